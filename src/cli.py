@@ -59,6 +59,8 @@ class VivisectCLI:
 
         file_hash = file_sub.add_parser('hash', help='Calculate file hashes')
         file_hash.add_argument('filepath', help='File to hash')
+        file_hash.add_argument('--algorithm', action='append', dest='algorithms',
+                               help='Hash algorithm (repeatable, e.g. sha256, blake2b, blake3)')
 
         file_metadata = file_sub.add_parser('metadata', help='Extract file metadata')
         file_metadata.add_argument('filepath', help='File to analyze')
@@ -85,9 +87,13 @@ class VivisectCLI:
         net_capture.add_argument('output', help='Output PCAP file')
         net_capture.add_argument('--duration', type=int, default=60, help='Capture duration (seconds)')
         net_capture.add_argument('--filter', help='BPF filter expression')
+        net_capture.add_argument('--snaplen', type=int, default=0, help='Bytes captured per packet (0 = whole packet)')
+        net_capture.add_argument('--buffer-kb', type=int, help='Kernel capture buffer size in KiB')
 
-        net_analyze = net_sub.add_parser('analyze', help='Analyze PCAP file')
-        net_analyze.add_argument('pcap', help='PCAP file to analyze')
+        net_analyze = net_sub.add_parser('analyze', help='Analyze PCAP files')
+        net_analyze.add_argument('pcap', nargs='+', help='PCAP file(s) to analyze')
+        net_analyze.add_argument('--parallelism', type=int, help='Number of files analyzed at once')
+        net_analyze.add_argument('--force', action='store_true', help='Ignore cached analysis results')
 
         net_extract = net_sub.add_parser('extract', help='Extract files from PCAP')
         net_extract.add_argument('pcap', help='PCAP file')
@@ -214,7 +220,7 @@ class VivisectCLI:
     def handle_file_commands(self, args):
         """Handle file analysis commands"""
         if args.file_command == 'hash':
-            hashes = self.file_analysis.calculate_hashes(args.filepath)
+            hashes = self.file_analysis.calculate_hashes(args.filepath, args.algorithms)
             print(f"\nHashes for {args.filepath}:")
             print("-" * 60)
             for algo, hash_val in hashes.items():
@@ -268,7 +274,8 @@ class VivisectCLI:
             print(f"Capturing traffic on {args.interface}...")
             result = self.network_forensics.capture_traffic(
                 args.interface, args.output,
-                duration=args.duration, filter_expression=args.filter
+                duration=args.duration, filter_expression=args.filter,
+                snaplen=args.snaplen, buffer_kb=args.buffer_kb
             )
             if result.get('success'):
                 print(f"✓ Capture saved: {result['output_file']}")
@@ -276,14 +283,22 @@ class VivisectCLI:
                 print(f"✗ Failed: {result.get('error')}")
 
         elif args.net_command == 'analyze':
-            print(f"Analyzing PCAP: {args.pcap}...")
-            result = self.network_forensics.analyze_pcap(args.pcap)
-            if 'error' not in result:
-                print(f"✓ Analysis complete")
-                if result.get('suspicious_activity'):
-                    print(f"  Suspicious activities found: {len(result['suspicious_activity'])}")
+            if len(args.pcap) == 1:
+                print(f"Analyzing PCAP: {args.pcap[0]}...")
+                results = {args.pcap[0]: self.network_forensics.analyze_pcap(args.pcap[0], force=args.force)}
             else:
-                print(f"✗ Failed: {result.get('error')}")
+                print(f"Analyzing {len(args.pcap)} PCAP files...")
+                results = self.network_forensics.analyze_pcaps(args.pcap, args.parallelism, force=args.force)
+
+            for pcap_file, result in results.items():
+                if len(results) > 1:
+                    print(f"{pcap_file}:")
+                if 'error' not in result:
+                    print(f"✓ Analysis complete")
+                    if result.get('suspicious_activity'):
+                        print(f"  Suspicious activities found: {len(result['suspicious_activity'])}")
+                else:
+                    print(f"✗ Failed: {result.get('error')}")
 
         elif args.net_command == 'extract':
             print(f"Extracting files from {args.pcap}...")
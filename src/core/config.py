@@ -22,12 +22,29 @@ class Config:
             'file_analysis': {
                 'enabled': True,
                 'scan_depth': 10,
-                'calculate_hashes': True
+                'calculate_hashes': True,
+                'parallel_scan': True,
+                'hash_workers': 8,
+                'hash_cache': True,
+                'hash_cache_persistent': False,
+                'hash_algorithms': ['md5', 'sha1', 'sha256'],
+                'parallel_hashing': True
             },
             'network_forensics': {
                 'enabled': True,
                 'capture_interface': 'eth0',
-                'max_capture_size': '1GB'
+                'max_capture_size': '1GB',
+                'analysis_parallelism': None,
+                'analysis_cache': False,
+                'capture_buffer_kb': 102400
+            },
+            'usb_gadget': {
+                'enabled': True,
+                'capture_block_kb': 4096,
+                'capture_block_count': 16,
+                'capture_retire_ms': 60,
+                'capture_duration': 600,
+                'capture_max_mb': 1024
             },
             'memory_analysis': {
                 'enabled': True,
@@ -39,6 +56,9 @@ class Config:
                 'registry_artifacts': True,
                 'system_logs': True
             }
+        },
+        'web': {
+            'use_x_sendfile': False
         }
     }
 
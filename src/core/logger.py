@@ -19,8 +19,8 @@ class ForensicsLogger:
         # Create main logger
         self.main_logger = self._create_logger('vivisect', 'main.log')
 
-    def _create_logger(self, name: str, filename: str) -> logging.Logger:
-        """Create a logger with file and console handlers"""
+    def _create_logger(self, name: str, filename: str, console: bool = True) -> logging.Logger:
+        """Create a logger with file and (optionally) console handlers"""
         logger = logging.getLogger(name)
         logger.setLevel(self.log_level)
 
@@ -33,20 +33,20 @@ class ForensicsLogger:
         file_handler = logging.FileHandler(log_file)
         file_handler.setLevel(self.log_level)
 
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.WARNING)
-
         # Formatter
         formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
-
         logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+
+        # Console handler
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setLevel(logging.WARNING)
+            console_handler.setFormatter(formatter)
+            logger.addHandler(console_handler)
 
         return logger
 
@@ -54,9 +54,12 @@ class ForensicsLogger:
         """Get or create a logger for a specific module"""
         if module_name not in self.loggers:
             filename = f"{module_name}.log"
+            # Records propagate to the main 'vivisect' logger, whose console
+            # handler already prints them; a second one would print twice
             self.loggers[module_name] = self._create_logger(
                 f"vivisect.{module_name}",
-                filename
+                filename,
+                console=False
             )
         return self.loggers[module_name]
 
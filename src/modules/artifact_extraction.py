@@ -4,6 +4,7 @@ import os
 import sqlite3
 import json
 import subprocess
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Any, Optional
@@ -478,20 +479,33 @@ class ArtifactExtraction:
                     directory
                 ]
 
-                result = subprocess.run(
+                # Stream grep output so memory stays bounded by the match limit
+                with subprocess.Popen(
                     grep_cmd,
-                    capture_output=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
                     text=True,
-                    timeout=120
-                )
-
-                if result.returncode == 0:
-                    for line in result.stdout.strip().split('\n')[:100]:  # Limit
-                        if line:
-                            findings.append({
-                                'pattern': pattern,
-                                'match': line[:200]  # Truncate long lines
-                            })
+                    errors='replace'
+                ) as proc:
+                    # Kill grep after 120s even while we are blocked reading it
+                    timer = threading.Timer(120, proc.kill)
+                    timer.start()
+                    try:
+                        hits = 0
+                        for line in proc.stdout:
+                            if hits >= 100:  # Limit
+                                proc.terminate()
+                                break
+                            line = line.rstrip('\n')
+                            if line:
+                                findings.append({
+                                    'pattern': pattern,
+                                    'match': line[:200]  # Truncate long lines
+                                })
+                                hits += 1
+                        proc.wait()
+                    finally:
+                        timer.cancel()
 
             return findings
 
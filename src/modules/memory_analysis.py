@@ -1,7 +1,10 @@
 """Memory analysis and forensics module"""
 
 import os
+import re
+import mmap
 import subprocess
+import threading
 import json
 from datetime import datetime
 from typing import Dict, List, Any, Optional
@@ -10,6 +13,19 @@ from pathlib import Path
 class MemoryAnalysis:
     """Handles memory dumping and analysis"""
 
+    # Strings in a memory dump worth flagging, matched case-insensitively
+    SUSPICIOUS_STRING_PATTERNS = [
+        'passwd', 'shadow', 'ssh', 'key',
+        'credit', 'card', 'password',
+        '/bin/bash', '/bin/sh'
+    ]
+    SUSPICIOUS_STRING_PATTERN = re.compile(
+        '|'.join(map(re.escape, SUSPICIOUS_STRING_PATTERNS)), re.IGNORECASE
+    )
+
+    # Printable run beginning with a command-like word and a space
+    BASH_COMMAND_PATTERN = re.compile(rb'(?<![\x20-\x7e\t])[A-Za-z0-9_/-]+ [\x20-\x7e\t]*')
+
     def __init__(self, logger, config):
         self.logger = logger.get_logger('memory_analysis')
         self.config = config
@@ -212,25 +228,8 @@ class MemoryAnalysis:
         self.logger.info("Extracting process list")
 
         try:
-            vol_cmd = ['vol.py', '-f', dump_file, 'linux.pslist.PsList']
-
-            result = subprocess.run(
-                vol_cmd,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
-
-            processes = []
-            if result.returncode == 0:
-                # Parse Volatility output
-                for line in result.stdout.split('\n')[2:]:  # Skip header
-                    if line.strip():
-                        # Parse process information
-                        # This is simplified - actual parsing would be more complex
-                        processes.append({'raw': line.strip()})
-
-            return processes
+            # Each row is kept raw - actual parsing would be more complex
+            return self._run_volatility_plugin(dump_file, 'linux.pslist.PsList')
 
         except Exception as e:
             self.logger.error(f"Process list extraction failed: {e}")
@@ -241,22 +240,7 @@ class MemoryAnalysis:
         self.logger.info("Extracting network connections")
 
         try:
-            vol_cmd = ['vol.py', '-f', dump_file, 'linux.netstat.Netstat']
-
-            result = subprocess.run(
-                vol_cmd,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
-
-            connections = []
-            if result.returncode == 0:
-                for line in result.stdout.split('\n')[2:]:
-                    if line.strip():
-                        connections.append({'raw': line.strip()})
-
-            return connections
+            return self._run_volatility_plugin(dump_file, 'linux.netstat.Netstat')
 
         except Exception as e:
             self.logger.error(f"Network connection extraction failed: {e}")
@@ -267,27 +251,42 @@ class MemoryAnalysis:
         self.logger.info("Extracting loaded modules")
 
         try:
-            vol_cmd = ['vol.py', '-f', dump_file, 'linux.lsmod.Lsmod']
-
-            result = subprocess.run(
-                vol_cmd,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
-
-            modules = []
-            if result.returncode == 0:
-                for line in result.stdout.split('\n')[2:]:
-                    if line.strip():
-                        modules.append({'raw': line.strip()})
-
-            return modules
+            return self._run_volatility_plugin(dump_file, 'linux.lsmod.Lsmod')
 
         except Exception as e:
             self.logger.error(f"Module extraction failed: {e}")
             return []
 
+    def _run_volatility_plugin(self, dump_file: str, plugin: str,
+                               timeout: int = 120) -> List[Dict[str, Any]]:
+        """Run a Volatility plugin and collect its output rows as they stream in"""
+        vol_cmd = ['vol.py', '-f', dump_file, plugin]
+
+        rows = []
+        with subprocess.Popen(
+            vol_cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1 << 20
+        ) as proc:
+            timer = threading.Timer(timeout, proc.kill)
+            timer.start()
+            try:
+                for line_number, line in enumerate(proc.stdout):
+                    if line_number < 2:  # Skip header
+                        continue
+                    line = line.strip()
+                    if line:
+                        rows.append({'raw': line})
+                proc.wait()
+            finally:
+                timer.cancel()
+
+        if proc.returncode != 0:
+            return []
+        return rows
+
     def _find_suspicious_processes(self, processes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Identify potentially suspicious processes"""
         suspicious = []
@@ -366,27 +365,29 @@ class MemoryAnalysis:
             vol_cmd = ['vol.py', '-f', dump_file, 'linux.pslist.PsList']
             # Compare with another process listing method to find hidden processes
 
-            # Scan for suspicious strings
+            # Scan for suspicious strings, filtering the whole dump as it streams
             strings_cmd = ['strings', dump_file]
-            result = subprocess.run(
+            suspicious_strings = findings['suspicious_strings']
+            with subprocess.Popen(
                 strings_cmd,
-                capture_output=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
                 text=True,
-                timeout=300
-            )
-
-            if result.returncode == 0:
-                suspicious_patterns = [
-                    'passwd', 'shadow', 'ssh', 'key',
-                    'credit', 'card', 'password',
-                    '/bin/bash', '/bin/sh'
-                ]
-
-                for line in result.stdout.split('\n')[:10000]:  # Limit
-                    for pattern in suspicious_patterns:
-                        if pattern in line.lower():
-                            findings['suspicious_strings'].append(line[:100])
-                            break
+                errors='replace',
+                bufsize=1 << 20
+            ) as proc:
+                timer = threading.Timer(300, proc.kill)
+                timer.start()
+                try:
+                    for line in proc.stdout:
+                        if self.SUSPICIOUS_STRING_PATTERN.search(line):
+                            suspicious_strings.append(line.rstrip('\n')[:100])
+                            if len(suspicious_strings) >= 10000:  # Limit
+                                proc.terminate()
+                                break
+                    proc.wait()
+                finally:
+                    timer.cancel()
 
             return findings
 
@@ -399,20 +400,21 @@ class MemoryAnalysis:
         self.logger.info("Extracting bash history from memory")
 
         try:
-            # Use strings and grep to find bash history
-            strings_cmd = f'strings {dump_file} | grep -E "^[a-zA-Z0-9_/-]+ "'
-
-            result = subprocess.run(
-                strings_cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
-
             commands = []
-            if result.returncode == 0:
-                commands = result.stdout.strip().split('\n')[:1000]  # Limit
+            if os.path.getsize(dump_file) == 0:
+                return commands
+
+            # Equivalent of `strings | grep -E "^[a-zA-Z0-9_/-]+ "`: a printable
+            # run that starts with a word followed by a space, matched in C
+            # directly over the mapped dump
+            with open(dump_file, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for match in self.BASH_COMMAND_PATTERN.finditer(mm):
+                    command = match.group()
+                    if len(command) >= 4:  # strings(1) minimum length
+                        commands.append(command.decode('ascii'))
+                        if len(commands) >= 1000:  # Limit
+                            break
 
             return commands
 
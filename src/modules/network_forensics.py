@@ -1,33 +1,139 @@
 """Network forensics and packet analysis module"""
 
 import os
+import re
+import csv
+import mmap
+import shlex
+import shutil
+import hashlib
+import struct
+import multiprocessing
 import subprocess
+import threading
 import json
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timezone
+from functools import partial
+from itertools import islice
+from typing import Dict, List, Any, Iterator, Optional
 from pathlib import Path
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Per-process NetworkForensics used by analyze_pcaps pool workers
+_worker_forensics = None
+
+def _init_worker(forensics):
+    """Install the NetworkForensics instance a pool worker analyzes with"""
+    global _worker_forensics
+    _worker_forensics = forensics
+
+def _analyze_one(pcap_file, force=False):
+    """Analyze a single PCAP inside a pool worker"""
+    return pcap_file, _worker_forensics.analyze_pcap(pcap_file, force=force)
+
 class NetworkForensics:
     """Handles network packet capture and analysis"""
 
+    # Per-packet fields read by the single analyze_pcap sweep; the free-text
+    # URI is last so it can absorb any '|' characters
+    SWEEP_FIELDS = [
+        'ip.src', 'ip.dst', 'tcp.dstport', 'tcp.flags.syn', 'tcp.flags.ack',
+        'http.request.method', 'http.host', 'dns.qry.name', 'http.request.uri'
+    ]
+
+    # Set flag values as printed by tshark releases before and after 4.0
+    FLAG_SET = ('1', 'True')
+
+    # Keywords marking an HTTP POST as a likely credential submission
+    CREDENTIAL_PATTERN = re.compile(r'login|password', re.IGNORECASE)
+
+    # Destination ports commonly used by C2 frameworks and reverse shells
+    C2_PORTS = frozenset({'4444', '5555', '6666', '7777', '8888', '31337'})
+
+    # BPF for the same ports, built once in ascending port order; the
+    # vlan branch also matches 802.1Q-tagged frames, as the tshark display
+    # filter does
+    _C2_BPF_PORTS = ' or '.join(f'tcp dst port {port}' for port in sorted(C2_PORTS, key=int))
+    C2_BPF_FILTER = f'({_C2_BPF_PORTS}) or (vlan and ({_C2_BPF_PORTS}))'
+
+    # Display filter used when tcpdump is not installed
+    C2_DISPLAY_FILTER = f"tcp.dstport in {{{','.join(sorted(C2_PORTS, key=int))}}}"
+
+    # Classic pcap magic numbers: (struct byte order, timestamp resolution)
+    PCAP_MAGIC = {
+        b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+        b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+        b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+        b'\xa1\xb2\x3c\x4d': ('>', 1e-9)
+    }
+
+    # capinfos report labels mapped onto the keys of _read_pcap_stats; the
+    # packet time labels differ between Wireshark releases
+    CAPINFOS_FIELDS = {
+        'File type': 'file_format',
+        'File encapsulation': 'link_type',
+        'Packet size limit': 'snaplen',
+        'Number of packets': 'packets',
+        'Data size': 'data_size',
+        'Capture duration': 'duration',
+        'Start time': 'first_packet',
+        'First packet time': 'first_packet',
+        'Earliest packet time': 'first_packet',
+        'End time': 'last_packet',
+        'Last packet time': 'last_packet',
+        'Latest packet time': 'last_packet'
+    }
+
+    # Number of PCAP sweeps kept in memory for reuse across methods
+    SWEEP_CACHE_SIZE = 8
+
     def __init__(self, logger, config):
         self.logger = logger.get_logger('network_forensics')
         self.config = config
         self.output_dir = config.get('output_dir')
+        # Persisting analyses under output_dir/.cache must be enabled
+        # explicitly; entries are keyed on path, mtime and size, not content
+        self.analysis_cache = config.get('modules.network_forensics.analysis_cache', False)
+        self.analysis_parallelism = config.get(
+            'modules.network_forensics.analysis_parallelism', None
+        ) or os.cpu_count() or 1
+        self._sweep_cache = OrderedDict()
+        self._sweep_lock = threading.Lock()
+
+    def __getstate__(self):
+        """Drop the sweep cache and its lock when sent to a worker process"""
+        state = self.__dict__.copy()
+        del state['_sweep_cache']
+        del state['_sweep_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._sweep_cache = OrderedDict()
+        self._sweep_lock = threading.Lock()
 
     def list_interfaces(self) -> List[Dict[str, Any]]:
         """List available network interfaces"""
         self.logger.info("Listing network interfaces")
 
         try:
+            # orjson parses bytes directly, so skip the text decode for it
             result = subprocess.run(
                 ['ip', '-j', 'link', 'show'],
                 capture_output=True,
-                text=True,
+                text=not HAS_ORJSON,
                 check=True
             )
 
-            interfaces = json.loads(result.stdout)
+            interfaces = orjson.loads(result.stdout) if HAS_ORJSON else json.loads(result.stdout)
             interface_list = []
 
             for iface in interfaces:
@@ -56,7 +162,8 @@ class NetworkForensics:
 
     def capture_traffic(self, interface: str, output_file: str,
                        duration: int = 60, packet_count: int = None,
-                       filter_expression: str = None) -> Dict[str, Any]:
+                       filter_expression: str = None, snaplen: int = 0,
+                       buffer_kb: int = None) -> Dict[str, Any]:
         """Capture network traffic to PCAP file"""
         self.logger.info(f"Starting packet capture on {interface}")
 
@@ -64,18 +171,34 @@ class NetworkForensics:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             output_path = os.path.join(self.output_dir, f"{output_file}_{timestamp}.pcap")
 
+            if buffer_kb is None:
+                buffer_kb = self.config.get('modules.network_forensics.capture_buffer_kb', 102400)
+
+            # A large kernel buffer absorbs bursts that would otherwise be
+            # dropped; immediate mode costs a little CPU but hands packets
+            # over as they arrive instead of when the buffer fills, and -U
+            # flushes each packet to the file so it is usable mid-capture
+            capture_args = [
+                'tcpdump', '-i', interface,
+                '-B', str(buffer_kb), '--immediate-mode', '-U',
+                '-s', str(snaplen),
+                '-w', output_path
+            ]
+
             # Build tcpdump command with timeout wrapper
             if packet_count:
                 # Use packet count limit
-                tcpdump_cmd = ['tcpdump', '-i', interface, '-w', output_path, '-c', str(packet_count)]
+                tcpdump_cmd = capture_args + ['-c', str(packet_count)]
             else:
                 # Use timeout command to limit duration
-                tcpdump_cmd = ['timeout', f'{duration}s', 'tcpdump', '-i', interface, '-w', output_path]
+                tcpdump_cmd = ['timeout', f'{duration}s'] + capture_args
 
+            # The BPF filter runs in the kernel, dropping unwanted packets
+            # before they are copied to the capture file
             if filter_expression:
                 tcpdump_cmd.append(filter_expression)
 
-            self.logger.info(f"Capture command: {' '.join(tcpdump_cmd)}")
+            self.logger.debug("Capture command: %s", tcpdump_cmd)
 
             # Execute tcpdump with timeout wrapper
             # timeout command exits with code 124 when it times out (this is normal)
@@ -99,7 +222,7 @@ class NetworkForensics:
                 'duration': duration,
                 'packet_count': packet_count,
                 'filter': filter_expression,
-                'command': ' '.join(tcpdump_cmd),
+                'command': shlex.join(tcpdump_cmd),
                 'timestamp': timestamp
             }
 
@@ -109,7 +232,7 @@ class NetworkForensics:
             self.logger.error(f"Packet capture failed: {e}")
             return {'success': False, 'error': str(e)}
 
-    def analyze_pcap(self, pcap_file: str) -> Dict[str, Any]:
+    def analyze_pcap(self, pcap_file: str, force: bool = False) -> Dict[str, Any]:
         """Analyze PCAP file and extract statistics"""
         self.logger.info(f"Analyzing PCAP file: {pcap_file}")
 
@@ -117,6 +240,15 @@ class NetworkForensics:
             return {'error': 'PCAP file not found'}
 
         try:
+            cache_path = None
+            if self.analysis_cache:
+                cache_path = self._analysis_cache_path(pcap_file)
+                if not force:
+                    cached = self._load_cached_analysis(cache_path)
+                    if cached is not None:
+                        self.logger.info(f"Using cached analysis for {pcap_file}")
+                        return cached
+
             analysis = {
                 'file': pcap_file,
                 'timestamp': datetime.now().isoformat(),
@@ -126,46 +258,36 @@ class NetworkForensics:
                 'suspicious_activity': []
             }
 
-            # Use tshark for detailed analysis
+            # Basic statistics and the tshark sweep are independent reads of
+            # the capture, so run them side by side when there are cores to spare
+            if self.analysis_parallelism > 1:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    stats_future = executor.submit(self._basic_statistics, pcap_file)
+                    sweep_future = executor.submit(self._get_sweep, pcap_file)
+                    basic = stats_future.result()
+                    sweep = sweep_future.result()
+            else:
+                basic = self._basic_statistics(pcap_file)
+                sweep = self._get_sweep(pcap_file)
+
             # Get basic statistics
-            stats_cmd = ['capinfos', '-M', pcap_file]
-            result = subprocess.run(stats_cmd, capture_output=True, text=True)
-            if result.returncode == 0:
-                analysis['statistics']['basic'] = result.stdout
-
-            # Get protocol hierarchy
-            proto_cmd = [
-                'tshark', '-r', pcap_file,
-                '-q', '-z', 'io,phs'
-            ]
-            result = subprocess.run(proto_cmd, capture_output=True, text=True, timeout=60)
-            if result.returncode == 0:
-                analysis['protocols']['hierarchy'] = result.stdout
-
-            # Get conversations
-            conv_cmd = [
-                'tshark', '-r', pcap_file,
-                '-q', '-z', 'conv,ip'
-            ]
-            result = subprocess.run(conv_cmd, capture_output=True, text=True, timeout=60)
-            if result.returncode == 0:
-                analysis['conversations'] = result.stdout
-
-            # Extract HTTP requests
-            http_cmd = [
-                'tshark', '-r', pcap_file,
-                '-Y', 'http.request',
-                '-T', 'fields',
-                '-e', 'http.host',
-                '-e', 'http.request.uri',
-                '-e', 'ip.src'
-            ]
-            result = subprocess.run(http_cmd, capture_output=True, text=True, timeout=60)
-            if result.returncode == 0 and result.stdout:
-                analysis['http_requests'] = result.stdout.strip().split('\n')
+            if basic is not None:
+                analysis['statistics']['basic'] = basic
 
-            # Look for suspicious patterns
-            analysis['suspicious_activity'] = self._detect_suspicious_traffic(pcap_file)
+            # Protocol hierarchy, conversations, HTTP requests and the
+            # suspicious-traffic signals all come from one tshark pass
+            if 'hierarchy' in sweep:
+                analysis['protocols']['hierarchy'] = sweep['hierarchy']
+            if 'conversations' in sweep:
+                analysis['conversations'] = sweep['conversations']
+            if sweep.get('http_requests'):
+                analysis['http_requests'] = sweep['http_requests']
+
+            analysis['suspicious_activity'] = sweep.get('suspicious_activity', [])
+
+            # Only cache complete analyses; an empty sweep means tshark failed
+            if cache_path and sweep:
+                self._store_cached_analysis(cache_path, analysis)
 
             return analysis
 
@@ -173,70 +295,346 @@ class NetworkForensics:
             self.logger.error(f"PCAP analysis failed: {e}")
             return {'error': str(e)}
 
-    def _detect_suspicious_traffic(self, pcap_file: str) -> List[Dict[str, Any]]:
-        """Detect potentially suspicious network activity"""
-        suspicious = []
+    def _analysis_cache_path(self, pcap_file: str) -> str:
+        """Cache file for a PCAP, named after its path, mtime and size so
+        any change to the capture misses the old entry"""
+        st = os.stat(pcap_file)
+        key = f"{os.path.realpath(pcap_file)}|{st.st_mtime_ns}|{st.st_size}"
+        digest = hashlib.sha1(key.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.output_dir, '.cache', f"{digest}.json")
 
+    def _load_cached_analysis(self, cache_path: str) -> Optional[Dict[str, Any]]:
+        """Load a cached analysis, or None if missing or unreadable"""
         try:
-            # Check for port scans
-            scan_cmd = [
-                'tshark', '-r', pcap_file,
-                '-Y', 'tcp.flags.syn==1 and tcp.flags.ack==0',
-                '-T', 'fields',
-                '-e', 'ip.src',
-                '-e', 'tcp.dstport'
-            ]
-            result = subprocess.run(scan_cmd, capture_output=True, text=True, timeout=60)
-            if result.returncode == 0 and result.stdout:
-                lines = result.stdout.strip().split('\n')
-                if len(lines) > 50:  # Threshold for scan detection
-                    suspicious.append({
-                        'type': 'potential_port_scan',
-                        'description': f'Detected {len(lines)} SYN packets',
-                        'severity': 'medium'
-                    })
-
-            # Check for DNS tunneling (unusually long DNS queries)
-            dns_cmd = [
-                'tshark', '-r', pcap_file,
-                '-Y', 'dns.qry.name',
-                '-T', 'fields',
-                '-e', 'dns.qry.name'
-            ]
-            result = subprocess.run(dns_cmd, capture_output=True, text=True, timeout=60)
-            if result.returncode == 0 and result.stdout:
-                for query in result.stdout.strip().split('\n'):
-                    if len(query) > 100:
-                        suspicious.append({
-                            'type': 'suspicious_dns_query',
-                            'description': f'Unusually long DNS query: {query[:50]}...',
-                            'severity': 'high'
-                        })
-                        break  # Only report first occurrence
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+            return orjson.loads(data) if HAS_ORJSON else json.loads(data)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable analysis cache {cache_path}: {e}")
+            return None
 
-            # Check for unencrypted credentials
-            cred_cmd = [
-                'tshark', '-r', pcap_file,
-                '-Y', 'http.request.method == "POST"',
-                '-T', 'fields',
-                '-e', 'http.host',
-                '-e', 'http.request.uri'
-            ]
-            result = subprocess.run(cred_cmd, capture_output=True, text=True, timeout=60)
-            if result.returncode == 0 and result.stdout:
-                for line in result.stdout.strip().split('\n'):
-                    if 'login' in line.lower() or 'password' in line.lower():
-                        suspicious.append({
-                            'type': 'unencrypted_credentials',
-                            'description': 'Potential credentials sent over HTTP',
-                            'severity': 'high'
-                        })
-                        break
+    def _store_cached_analysis(self, cache_path: str, analysis: Dict[str, Any]) -> None:
+        """Write an analysis to the cache, replacing any previous entry atomically"""
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            data = orjson.dumps(analysis) if HAS_ORJSON else json.dumps(analysis).encode('utf-8')
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            self.logger.warning(f"Could not write analysis cache {cache_path}: {e}")
+
+    def _basic_statistics(self, pcap_file: str) -> Optional[Dict[str, Any]]:
+        """File-level capture statistics, falling back to capinfos for
+        formats other than classic pcap"""
+        stats = self._read_pcap_stats(pcap_file)
+        if stats is not None:
+            return stats
+
+        # -S reports packet times as epoch seconds, converted like the pcap path
+        result = subprocess.run(['capinfos', '-M', '-S', pcap_file], capture_output=True, text=True)
+        if result.returncode == 0:
+            return self._parse_capinfos(result.stdout)
+        return None
+
+    def _parse_capinfos(self, output: str) -> Dict[str, Any]:
+        """Map a capinfos report onto the keys used for classic pcap; the
+        raw report is kept under 'capinfos' when nothing is recognized"""
+        stats = {}
+        for line in output.splitlines():
+            label, sep, value = line.partition(':')
+            key = self.CAPINFOS_FIELDS.get(label.strip())
+            value = value.strip()
+            if not sep or key is None or not value:
+                continue
+
+            try:
+                if key in ('packets', 'data_size', 'snaplen'):
+                    number = re.search(r'\d+', value)
+                    if number is None:
+                        continue
+                    stats[key] = int(number.group())
+                elif key == 'duration':
+                    stats[key] = float(value.split()[0])
+                elif key in ('first_packet', 'last_packet'):
+                    stats[key] = datetime.fromtimestamp(float(value), timezone.utc).isoformat()
+                else:
+                    stats[key] = value
+            except (ValueError, OverflowError, OSError):
+                continue
+
+        return stats or {'capinfos': output}
+
+    def _read_pcap_stats(self, pcap_file: str) -> Optional[Dict[str, Any]]:
+        """Summarize a classic pcap file from its record headers alone;
+        returns None for pcapng and anything else that is not classic pcap"""
+        with open(pcap_file, 'rb') as f:
+            header = f.read(24)
+            if len(header) < 24 or header[:4] not in self.PCAP_MAGIC:
+                return None
+
+            byte_order, ts_resolution = self.PCAP_MAGIC[header[:4]]
+            _, major, minor, _, _, snaplen, link_type = struct.unpack(byte_order + 'IHHiIII', header)
+            record_header = struct.Struct(byte_order + 'IIII')
+            file_size = os.fstat(f.fileno()).st_size
+
+            packets = data_size = original_size = 0
+            first_ts = last_ts = None
+            offset = 24
+            truncated = False
+
+            if file_size > offset:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Only the 16-byte record headers are read; packet data
+                    # is skipped by offset arithmetic
+                    while offset < file_size:
+                        if offset + 16 > file_size:
+                            truncated = True
+                            break
+                        ts_sec, ts_frac, caplen, origlen = record_header.unpack_from(mm, offset)
+                        offset += 16 + caplen
+                        if offset > file_size:
+                            truncated = True
+                            break
+
+                        packets += 1
+                        data_size += caplen
+                        original_size += origlen
+                        ts = ts_sec + ts_frac * ts_resolution
+                        if first_ts is None or ts < first_ts:
+                            first_ts = ts
+                        if last_ts is None or ts > last_ts:
+                            last_ts = ts
+
+        stats = {
+            'file_format': f'pcap {major}.{minor}',
+            'link_type': link_type,
+            'snaplen': snaplen,
+            'packets': packets,
+            'data_size': data_size,
+            'original_size': original_size,
+            'truncated': truncated
+        }
+        if first_ts is not None:
+            stats['first_packet'] = datetime.fromtimestamp(first_ts, timezone.utc).isoformat()
+            stats['last_packet'] = datetime.fromtimestamp(last_ts, timezone.utc).isoformat()
+            stats['duration'] = last_ts - first_ts
+
+        return stats
+
+    def analyze_pcaps(self, pcap_files: List[str], parallelism: Optional[int] = None,
+                      force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Analyze several PCAP files, one worker process per file"""
+        parallelism = min(parallelism or self.analysis_parallelism, len(pcap_files))
+        self.logger.info(f"Analyzing {len(pcap_files)} PCAP files with {parallelism} workers")
+
+        results = {}
+        if parallelism <= 1:
+            for pcap_file in pcap_files:
+                results[pcap_file] = self.analyze_pcap(pcap_file, force=force)
+        else:
+            try:
+                with multiprocessing.Pool(parallelism, initializer=_init_worker,
+                                          initargs=(self,)) as pool:
+                    worker = partial(_analyze_one, force=force)
+                    for pcap_file, analysis in pool.imap_unordered(worker, pcap_files):
+                        results[pcap_file] = analysis
+            except Exception as e:
+                self.logger.error(f"Batch PCAP analysis failed: {e}")
+                return {pcap_file: results.get(pcap_file, {'error': str(e)})
+                        for pcap_file in pcap_files}
+
+        # Report in the order the files were given
+        return {pcap_file: results[pcap_file] for pcap_file in pcap_files}
+
+    def _sweep_key(self, pcap_file: str) -> tuple:
+        """Sweep cache key; changes whenever the capture file does"""
+        st = os.stat(pcap_file)
+        return (os.path.realpath(pcap_file), st.st_size, st.st_mtime_ns)
+
+    def _cached_sweep(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """Return an already computed sweep, or None"""
+        with self._sweep_lock:
+            sweep = self._sweep_cache.get(key)
+            if sweep is not None:
+                self._sweep_cache.move_to_end(key)
+            return sweep
+
+    def _get_sweep(self, pcap_file: str) -> Dict[str, Any]:
+        """Return the sweep for a PCAP, reusing it while the file is unchanged"""
+        key = self._sweep_key(pcap_file)
+        sweep = self._cached_sweep(key)
+        if sweep is not None:
+            return sweep
+
+        sweep = self._sweep_pcap(pcap_file)
+        if sweep:
+            with self._sweep_lock:
+                self._sweep_cache[key] = sweep
+                while len(self._sweep_cache) > self.SWEEP_CACHE_SIZE:
+                    self._sweep_cache.popitem(last=False)
+        return sweep
+
+    def _sweep_pcap(self, pcap_file: str, timeout: int = 300) -> Dict[str, Any]:
+        """Read a PCAP once, collecting per-packet signals and the io,phs
+        and conv,ip reports (printed after the packet rows)"""
+        sweep_cmd = ['tshark', '-n', '-r', pcap_file, '-T', 'fields',
+                     '-E', 'separator=|', '-E', 'occurrence=f',
+                     '-z', 'io,phs', '-z', 'conv,ip']
+        for field in self.SWEEP_FIELDS:
+            sweep_cmd += ['-e', field]
+
+        http_requests = []
+        long_dns_query = None
+        credentials_seen = False
+        c2_connections = []
+        syn_packets = 0
+        stats_lines = []
+
+        try:
+            with subprocess.Popen(
+                sweep_cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                errors='replace'
+            ) as proc:
+                timer = threading.Timer(timeout, proc.kill)
+                timer.start()
+                try:
+                    for line in proc.stdout:
+                        # Statistics start at the first '='-rule line
+                        if stats_lines or self._is_rule_line(line):
+                            stats_lines.append(line)
+                            continue
+
+                        # The URI is last so a '|' inside it stays intact
+                        parts = line.rstrip('\n').split('|', len(self.SWEEP_FIELDS) - 1)
+                        if len(parts) < len(self.SWEEP_FIELDS):
+                            continue
+                        src, dst, dport, syn, ack, method, host, dns_name, uri = parts
+
+                        # Port scans: SYN without ACK
+                        if syn in self.FLAG_SET and ack not in self.FLAG_SET:
+                            syn_packets += 1
+
+                        if dport in self.C2_PORTS:
+                            c2_connections.append(f"{dst}\t{dport}")
+
+                        # DNS tunneling: unusually long query names
+                        if long_dns_query is None and len(dns_name) > 100:
+                            long_dns_query = dns_name
+
+                        if method:
+                            http_requests.append(f"{host}\t{uri}\t{src}")
+
+                            # Unencrypted credentials in HTTP POSTs
+                            if method == 'POST' and not credentials_seen:
+                                if (self.CREDENTIAL_PATTERN.search(host) or
+                                        self.CREDENTIAL_PATTERN.search(uri)):
+                                    credentials_seen = True
+                    proc.wait()
+                finally:
+                    timer.cancel()
+
+            if proc.returncode != 0:
+                self.logger.warning(f"tshark exited with status {proc.returncode} for {pcap_file}")
+                return {}
 
         except Exception as e:
-            self.logger.error(f"Suspicious traffic detection failed: {e}")
+            self.logger.error(f"PCAP sweep failed: {e}")
+            return {}
 
-        return suspicious
+        sweep = {}
+        for block in self._split_stats_blocks(stats_lines):
+            if 'Protocol Hierarchy' in block:
+                sweep['hierarchy'] = block
+            elif 'Conversations' in block:
+                sweep['conversations'] = block
+
+        suspicious = []
+        if syn_packets > 50:  # Threshold for scan detection
+            suspicious.append({
+                'type': 'potential_port_scan',
+                'description': f'Detected {syn_packets} SYN packets',
+                'severity': 'medium'
+            })
+        if long_dns_query is not None:
+            suspicious.append({
+                'type': 'suspicious_dns_query',
+                'description': f'Unusually long DNS query: {long_dns_query[:50]}...',
+                'severity': 'high'
+            })
+        if credentials_seen:
+            suspicious.append({
+                'type': 'unencrypted_credentials',
+                'description': 'Potential credentials sent over HTTP',
+                'severity': 'high'
+            })
+
+        sweep['http_requests'] = http_requests
+        sweep['suspicious_activity'] = suspicious
+        sweep['c2_connections'] = c2_connections
+
+        return sweep
+
+    @staticmethod
+    def _is_rule_line(line: str) -> bool:
+        """True for the '=====' lines tshark uses to frame -z reports"""
+        stripped = line.strip()
+        return bool(stripped) and stripped.count('=') == len(stripped)
+
+    def _split_stats_blocks(self, lines: List[str]) -> List[str]:
+        """Split tshark -z output into its '='-framed report blocks"""
+        blocks = []
+        current = None
+        for line in lines:
+            if self._is_rule_line(line):
+                if current is None:
+                    current = [line]
+                else:
+                    current.append(line)
+                    blocks.append(''.join(current))
+                    current = None
+            elif current is not None:
+                current.append(line)
+        return blocks
+
+    def _stream_tshark(self, cmd: List[str], timeout: int, stdin=None) -> Iterator[str]:
+        """Yield tshark output lines as they arrive; closing the generator
+        early stops tshark instead of letting it finish the capture"""
+        # No preexec_fn here or anywhere else in this module, so CPython
+        # 3.10+ starts children with vfork and never copies the parent's
+        # page tables. close_fds stays on: the web server's sockets must
+        # not leak into tshark and tcpdump.
+        proc = subprocess.Popen(
+            cmd,
+            stdin=stdin,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            errors='replace'
+        )
+        timer = threading.Timer(timeout, proc.kill)
+        timer.start()
+        try:
+            yield from proc.stdout
+            proc.wait()
+            if proc.returncode != 0:
+                self.logger.warning(f"tshark exited with status {proc.returncode}")
+        finally:
+            timer.cancel()
+            if proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                    proc.wait()
+            proc.stdout.close()
 
     def extract_files_from_pcap(self, pcap_file: str, output_dir: str = None) -> Dict[str, Any]:
         """Extract files transferred over network from PCAP"""
@@ -250,11 +648,11 @@ class NetworkForensics:
         try:
             # Use networkminer or tshark to extract files
             export_cmd = [
-                'tshark', '-r', pcap_file,
+                'tshark', '-n', '-r', pcap_file,
                 '--export-objects', f'http,{output_dir}'
             ]
 
-            self.logger.info(f"Export command: {' '.join(export_cmd)}")
+            self.logger.debug("Export command: %s", export_cmd)
 
             # Execute tshark export
             process = subprocess.run(
@@ -274,19 +672,19 @@ class NetworkForensics:
                 'pcap_file': pcap_file,
                 'output_dir': output_dir,
                 'extracted_files': [],
-                'command': ' '.join(export_cmd)
+                'command': shlex.join(export_cmd)
             }
 
             # List extracted files
             if os.path.exists(output_dir):
-                for filename in os.listdir(output_dir):
-                    filepath = os.path.join(output_dir, filename)
-                    if os.path.isfile(filepath):
-                        result['extracted_files'].append({
-                            'name': filename,
-                            'path': filepath,
-                            'size': os.path.getsize(filepath)
-                        })
+                with os.scandir(output_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            result['extracted_files'].append({
+                                'name': entry.name,
+                                'path': entry.path,
+                                'size': entry.stat(follow_symlinks=False).st_size
+                            })
 
             return result
 
@@ -300,7 +698,7 @@ class NetworkForensics:
 
         try:
             timeline_cmd = [
-                'tshark', '-r', pcap_file,
+                'tshark', '-n', '-r', pcap_file,
                 '-T', 'fields',
                 '-e', 'frame.time',
                 '-e', 'ip.src',
@@ -311,27 +709,20 @@ class NetworkForensics:
                 '-E', 'separator=|'
             ]
 
-            result = subprocess.run(
-                timeline_cmd,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
-
             timeline = []
-            if result.returncode == 0:
-                for line in result.stdout.strip().split('\n')[:1000]:  # Limit to first 1000
-                    if line:
-                        parts = line.split('|')
-                        if len(parts) >= 6:
-                            timeline.append({
-                                'timestamp': parts[0],
-                                'src_ip': parts[1],
-                                'dst_ip': parts[2],
-                                'src_port': parts[3],
-                                'dst_port': parts[4],
-                                'protocols': parts[5]
-                            })
+            with closing(self._stream_tshark(timeline_cmd, timeout=120)) as lines:
+                rows = csv.reader(lines, delimiter='|', quoting=csv.QUOTE_NONE)
+                for row in islice(rows, 1000):  # Limit to first 1000
+                    if len(row) >= 6:
+                        timestamp, src_ip, dst_ip, src_port, dst_port, protocols = row[:6]
+                        timeline.append({
+                            'timestamp': timestamp,
+                            'src_ip': src_ip,
+                            'dst_ip': dst_ip,
+                            'src_port': src_port,
+                            'dst_port': dst_port,
+                            'protocols': protocols
+                        })
 
             return timeline
 
@@ -345,7 +736,7 @@ class NetworkForensics:
 
         try:
             dns_cmd = [
-                'tshark', '-r', pcap_file,
+                'tshark', '-n', '-r', pcap_file,
                 '-Y', 'dns.flags.response == 0',
                 '-T', 'fields',
                 '-e', 'frame.time',
@@ -355,49 +746,71 @@ class NetworkForensics:
                 '-E', 'separator=|'
             ]
 
-            result = subprocess.run(
-                dns_cmd,
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
+            # Keep the raw rows and aggregate them in C-level passes at the end
+            queries = []
+            with closing(self._stream_tshark(dns_cmd, timeout=60)) as lines:
+                # tshark emits exactly the four requested fields, so rows are
+                # kept as csv produced them; only an oversized row is trimmed
+                for row in csv.reader(lines, delimiter='|', quoting=csv.QUOTE_NONE):
+                    if len(row) == 4:
+                        queries.append(row)
+                    elif len(row) > 4:
+                        queries.append(row[:4])
 
             dns_analysis = {
-                'total_queries': 0,
-                'unique_domains': set(),
-                'query_types': {},
+                'total_queries': len(queries),
+                # The set only holds references to strings already kept in
+                # queries, so it costs a pointer slot per domain, not a copy
+                'unique_domains': list({row[2] for row in queries}),
+                'query_types': dict(Counter(row[3] for row in queries)),
                 'suspicious': [],
-                'queries': []
+                'queries': [
+                    {'timestamp': timestamp, 'source': source, 'domain': domain, 'type': query_type}
+                    for timestamp, source, domain, query_type in queries
+                ]
             }
 
-            if result.returncode == 0:
-                for line in result.stdout.strip().split('\n'):
-                    if line:
-                        parts = line.split('|')
-                        if len(parts) >= 4:
-                            domain = parts[2]
-                            query_type = parts[3]
-
-                            dns_analysis['total_queries'] += 1
-                            dns_analysis['unique_domains'].add(domain)
-                            dns_analysis['query_types'][query_type] = \
-                                dns_analysis['query_types'].get(query_type, 0) + 1
-
-                            dns_analysis['queries'].append({
-                                'timestamp': parts[0],
-                                'source': parts[1],
-                                'domain': domain,
-                                'type': query_type
-                            })
-
-            dns_analysis['unique_domains'] = list(dns_analysis['unique_domains'])
-
             return dns_analysis
 
         except Exception as e:
             self.logger.error(f"DNS analysis failed: {e}")
             return {'error': str(e)}
 
+    def _filtered_c2_connections(self, pcap_file: str, timeout: int = 60) -> List[str]:
+        """List connections to C2 ports, letting tcpdump's BPF filter drop
+        every other packet before tshark dissects anything"""
+        fields = ['-T', 'fields', '-e', 'ip.dst', '-e', 'tcp.dstport']
+        connections = []
+
+        tcpdump = shutil.which('tcpdump')
+        if tcpdump is None:
+            # Without tcpdump, tshark dissects everything and filters itself
+            fields_cmd = ['tshark', '-n', '-r', pcap_file, '-Y', self.C2_DISPLAY_FILTER, *fields]
+            with closing(self._stream_tshark(fields_cmd, timeout)) as lines:
+                for line in lines:
+                    line = line.rstrip('\n')
+                    if line:
+                        connections.append(line)
+            return connections
+
+        filter_cmd = [tcpdump, '-n', '-r', pcap_file, '-w', '-', self.C2_BPF_FILTER]
+        fields_cmd = ['tshark', '-n', '-r', '-', *fields]
+
+        with subprocess.Popen(filter_cmd, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL) as filtered:
+            try:
+                with closing(self._stream_tshark(fields_cmd, timeout, stdin=filtered.stdout)) as lines:
+                    for line in lines:
+                        line = line.rstrip('\n')
+                        if line:
+                            connections.append(line)
+            finally:
+                # A tcpdump still running here has nobody left reading its output
+                if filtered.poll() is None:
+                    filtered.kill()
+
+        return connections
+
     def detect_c2_traffic(self, pcap_file: str) -> Dict[str, Any]:
         """Detect potential Command & Control traffic patterns"""
         self.logger.info(f"Detecting C2 traffic patterns in {pcap_file}")
@@ -413,25 +826,19 @@ class NetworkForensics:
             # This would require more sophisticated analysis
             # For now, we log the attempt
 
-            # Check for connections to suspicious ports
-            suspicious_ports = [4444, 5555, 6666, 7777, 8888, 31337]
-
-            port_cmd = [
-                'tshark', '-r', pcap_file,
-                '-Y', f'tcp.dstport in {{{",".join(map(str, suspicious_ports))}}}',
-                '-T', 'fields',
-                '-e', 'ip.dst',
-                '-e', 'tcp.dstport'
-            ]
+            # Reuse the analyze_pcap sweep when there is one; otherwise only
+            # the packets that pass the BPF filter are dissected
+            sweep = self._cached_sweep(self._sweep_key(pcap_file))
+            if sweep is not None:
+                connections = sweep.get('c2_connections', [])
+            else:
+                connections = self._filtered_c2_connections(pcap_file)
 
-            result = subprocess.run(port_cmd, capture_output=True, text=True, timeout=60)
-            if result.returncode == 0 and result.stdout:
-                for line in result.stdout.strip().split('\n'):
-                    if line:
-                        indicators['unusual_protocols'].append({
-                            'description': f'Connection to suspicious port: {line}',
-                            'severity': 'high'
-                        })
+            for connection in connections:
+                indicators['unusual_protocols'].append({
+                    'description': f'Connection to suspicious port: {connection}',
+                    'severity': 'high'
+                })
 
             return indicators
 
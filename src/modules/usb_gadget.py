@@ -1,14 +1,120 @@
 """USB Gadget Mode for Vivisect"""
 
 import os
+import re
+import sys
+import atexit
+import mmap
+import select
+import socket
+import struct
+import threading
+import shutil
+import fnmatch
 import subprocess
 import time
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, List, Any, Iterator, Optional
 
 class USBGadget:
     """Manages USB gadget mode for forensics collection"""
 
+    # Seconds a system probe result is reused, so one status snapshot
+    # (or a burst of dashboard polls) reads /proc/modules and queries
+    # the interface only once
+    PROBE_TTL = 1.0
+
+    # Interface state is read from sysfs rather than by running `ip`
+    SYSFS_NET = '/sys/class/net'
+    IFF_UP = 0x1
+
+    # Socket states as numbered in /proc/net/{tcp,udp}
+    SOCKET_STATES = {
+        '01': 'ESTAB', '02': 'SYN-SENT', '03': 'SYN-RECV', '04': 'FIN-WAIT-1',
+        '05': 'FIN-WAIT-2', '06': 'TIME-WAIT', '07': 'UNCONN', '08': 'CLOSE-WAIT',
+        '09': 'LAST-ACK', '0A': 'LISTEN', '0B': 'CLOSING'
+    }
+    TCP_LISTEN = '0A'
+
+    # sock_diag over netlink, from <linux/netlink.h> and <linux/inet_diag.h>
+    NETLINK_SOCK_DIAG = 4
+    SOCK_DIAG_BY_FAMILY = 20
+    NLM_F_REQUEST = 0x1
+    NLM_F_DUMP = 0x300
+    NLMSG_ERROR = 2
+    NLMSG_DONE = 3
+    NLMSG_HDR = struct.Struct('=IHHII')
+    NLM_F_ACK = 0x4
+    NLM_F_EXCL = 0x200
+    NLM_F_CREATE = 0x400
+    # inet_diag_req_v2 with a zeroed 48-byte inet_diag_sockid
+    DIAG_REQ = struct.Struct('=BBBBI48s')
+    # Pieces of inet_diag_msg: family/state, the big-endian ports that open
+    # the sockid, and uid/inode after the expires/rqueue/wqueue counters
+    DIAG_MSG_STATE = struct.Struct('=BB')
+    DIAG_MSG_PORTS = struct.Struct('>HH')
+    DIAG_MSG_OWNER = struct.Struct('=II')
+    # rtnetlink requests used by configure_network, from <linux/rtnetlink.h>:
+    # ifinfomsg, ifaddrmsg, rtmsg and the rtattr header
+    RTM_NEWLINK = 16
+    RTM_NEWADDR = 20
+    RTM_NEWROUTE = 24
+    IFINFO_MSG = struct.Struct('=BxHiII')
+    IFADDR_MSG = struct.Struct('=BBBBi')
+    RT_MSG = struct.Struct('=BBBBBBBBI')
+    RT_ATTR = struct.Struct('=HH')
+    IFA_ADDRESS = 1
+    IFA_LOCAL = 2
+    RTA_DST = 1
+    RTA_OIF = 4
+    RT_TABLE_MAIN = 254
+    RTPROT_BOOT = 3
+    RT_SCOPE_LINK = 253
+    RTN_UNICAST = 1
+
+    # Family, protocol, /proc/net name and the bitmask of socket states to
+    # dump: every TCP state but LISTEN, and only connected UDP sockets
+    DIAG_QUERIES = (
+        (socket.AF_INET, socket.IPPROTO_TCP, 'tcp', 0xffe & ~(1 << 10)),
+        (socket.AF_INET6, socket.IPPROTO_TCP, 'tcp6', 0xffe & ~(1 << 10)),
+        (socket.AF_INET, socket.IPPROTO_UDP, 'udp', 1 << 1),
+        (socket.AF_INET6, socket.IPPROTO_UDP, 'udp6', 1 << 1),
+    )
+
+    # vfat stores modification times with 2 second resolution, so copies
+    # within that window of their source count as up to date
+    MTIME_WINDOW_NS = 2_000_000_000
+    UDP_CONNECTED = '01'
+
+    # Loaded modules reported by the status calls, matched anywhere in the name
+    GADGET_MODULE_PATTERN = re.compile(r'g_ether|g_multi|dwc2')
+    FUNCTION_MODULE_PATTERN = re.compile(r'g_ether|g_multi|g_serial|g_mass_storage|usb_f_|dwc2')
+
+    # External tools this module runs, resolved on PATH once per instance
+    TOOLS = ('modprobe', 'nmap', 'mkfs.vfat', 'mkfs.ext4',
+             'mount', 'umount', 'stty', 'iptables-restore')
+
+    # AF_PACKET receive ring, from <linux/if_packet.h>
+    ETH_P_ALL = 0x0003
+    SOL_PACKET = 263
+    PACKET_RX_RING = 5
+    PACKET_VERSION = 10
+    TPACKET_V3 = 2
+    TP_STATUS_KERNEL = 0
+    TP_STATUS_USER = 1
+    RING_FRAME_SIZE = 2048
+
+    # tpacket_req3, the block_status/num_pkts/offset_to_first_pkt fields of
+    # tpacket_block_desc, and the leading fields of tpacket3_hdr
+    RING_REQ = struct.Struct('=IIIIIII')
+    BLOCK_HDR = struct.Struct('=III')
+    BLOCK_STATUS = struct.Struct('=I')
+    FRAME_HDR = struct.Struct('=IIIIIIH')
+
+    # Nanosecond-resolution pcap, so kernel timestamps are kept as-is
+    PCAP_HEADER = struct.pack('=IHHiIII', 0xa1b23c4d, 2, 4, 0, 0, 262144, 1)
+    PCAP_RECORD = struct.Struct('=IIII')
+
     def __init__(self, logger, config):
         self.logger = logger.get_logger('usb_gadget')
         self.config = config
@@ -24,40 +130,247 @@ class USBGadget:
         self.hid_device = '/dev/hidg0'
         self.gadget_mode = 'multi'  # 'ether', 'multi', 'serial', 'mass_storage', 'hid'
 
+        # Capture ring geometry; the block size must be a multiple of the
+        # page size, and a partly filled block is handed over after the
+        # retire timeout
+        self.capture_block_size = config.get('modules.usb_gadget.capture_block_kb', 4096) * 1024
+        self.capture_block_count = config.get('modules.usb_gadget.capture_block_count', 16)
+        self.capture_retire_ms = config.get('modules.usb_gadget.capture_retire_ms', 60)
+
+        # Default bounds on a capture, so an unattended one cannot fill the
+        # disk; 0 disables a bound
+        self.capture_duration = config.get('modules.usb_gadget.capture_duration', 600)
+        self.capture_max_bytes = config.get('modules.usb_gadget.capture_max_mb', 1024) << 20
+
+        # Background ring capture started by start_packet_capture
+        self._capture_thread = None
+        self._capture_stop = None
+        self._capture_stats = {}
+
+        # The capture thread is a daemon; stop it at exit so the block the
+        # kernel still holds is drained into the file
+        atexit.register(self._stop_capture_at_exit)
+
+        # Recent probe results: key -> (monotonic time, value)
+        self._probe_cache = {}
+
+        # Absolute path of each external tool, or None when not installed
+        self._bin = {name: shutil.which(name) for name in self.TOOLS}
+
+        # Fixed fields of the multi-function status, copied per snapshot
+        self._status_functions = {
+            'network': {
+                'interface': self.gadget_interface,
+                'device_ip': self.device_ip,
+                'host_ip': self.host_ip
+            },
+            'mass_storage': {
+                'backing_file': self.mass_storage_file,
+                'mount_point': self.mass_storage_mount
+            },
+            'serial': {
+                'device': self.serial_device
+            }
+        }
+
+    def _tool(self, name: str) -> str:
+        """Absolute path of an external tool, raising if it is not installed"""
+        path = self._bin.get(name)
+        if path is None:
+            raise Exception(f"{name} is not installed")
+        return path
+
+    def _cached_probe(self, key: str, probe):
+        """Return a recent result for this probe, or run it and remember it"""
+        now = time.monotonic()
+        entry = self._probe_cache.get(key)
+        if entry is not None and now - entry[0] < self.PROBE_TTL:
+            return entry[1]
+        value = probe()
+        self._probe_cache[key] = (now, value)
+        return value
+
+    def _invalidate_probes(self) -> None:
+        """Forget cached probe results after changing gadget or network state"""
+        self._probe_cache.clear()
+
     def is_gadget_enabled(self) -> bool:
         """Check if USB gadget mode is enabled"""
         try:
             # Check if g_ether or g_multi module is loaded
-            result = subprocess.run(
-                ['lsmod'],
-                capture_output=True,
-                text=True
-            )
-
-            return 'g_ether' in result.stdout or 'g_multi' in result.stdout
+            modules = self._loaded_modules()
+            return 'g_ether' in modules or 'g_multi' in modules
         except Exception as e:
             self.logger.error(f"Failed to check gadget status: {e}")
             return False
 
+    def _loaded_modules(self) -> List[str]:
+        """Names of loaded kernel modules"""
+        return self._cached_probe('modules', self._read_proc_modules)
+
+    def _read_proc_modules(self) -> List[str]:
+        """Read loaded module names straight from /proc/modules"""
+        try:
+            with open('/proc/modules') as f:
+                return [line.split(None, 1)[0] for line in f if line.strip()]
+        except FileNotFoundError:
+            # Kernel built without loadable module support
+            return []
+
     def is_connected_to_host(self) -> bool:
         """Check if device is connected to a host PC via USB"""
         try:
-            # Check if usb0 interface exists and is up
-            result = subprocess.run(
-                ['ip', 'link', 'show', self.gadget_interface],
-                capture_output=True,
-                text=True
-            )
-
-            if result.returncode == 0:
-                # Check if interface is UP
-                return 'state UP' in result.stdout or 'UP' in result.stdout
-
-            return False
+            return self._cached_probe('connected', self._probe_connected)
         except Exception as e:
             self.logger.error(f"Failed to check USB connection: {e}")
             return False
 
+    def _probe_connected(self) -> bool:
+        """Query whether the gadget interface is up with a host attached"""
+        # The kernel exposes the interface flags in sysfs; a missing
+        # directory means the interface does not exist
+        iface = os.path.join(self.SYSFS_NET, self.gadget_interface)
+        try:
+            with open(os.path.join(iface, 'flags'), 'rb') as f:
+                flags = int(f.read(), 16)
+        except FileNotFoundError:
+            return False
+
+        if not flags & self.IFF_UP:
+            return False
+
+        # Carrier is only raised while a host has the gadget link active
+        with open(os.path.join(iface, 'carrier'), 'rb') as f:
+            return f.read().strip() == b'1'
+
+    def _read_interface_stats(self) -> Dict[str, int]:
+        """Read the gadget interface's counters from sysfs"""
+        stats = {}
+        with os.scandir(os.path.join(self.SYSFS_NET, self.gadget_interface, 'statistics')) as entries:
+            for entry in entries:
+                with open(entry.path) as f:
+                    stats[entry.name] = int(f.read())
+        return stats
+
+    def _read_sockets(self) -> List[Dict[str, Any]]:
+        """Active TCP and UDP sockets, as `ss -tun` would list them
+        (listening TCP and unconnected UDP sockets are skipped)"""
+        try:
+            return self._read_diag_sockets()
+        except OSError as e:
+            # sock_diag unavailable (e.g. inet_diag not built); the text
+            # tables in /proc/net carry the same information
+            self.logger.debug("sock_diag query failed, reading /proc/net: %s", e)
+            return self._read_proc_sockets()
+
+    def _read_diag_sockets(self) -> List[Dict[str, Any]]:
+        """Dump sockets over NETLINK_SOCK_DIAG, filtering states in the kernel"""
+        sockets = []
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, self.NETLINK_SOCK_DIAG) as nl:
+            for seq, (family, proto, name, states) in enumerate(self.DIAG_QUERIES, 1):
+                nl.send(self.NLMSG_HDR.pack(
+                    self.NLMSG_HDR.size + self.DIAG_REQ.size, self.SOCK_DIAG_BY_FAMILY,
+                    self.NLM_F_REQUEST | self.NLM_F_DUMP, seq, 0
+                ) + self.DIAG_REQ.pack(family, proto, 0, 0, states, b''))
+
+                for payload in self._netlink_dump(nl):
+                    _, state = self.DIAG_MSG_STATE.unpack_from(payload)
+                    sport, dport = self.DIAG_MSG_PORTS.unpack_from(payload, 4)
+                    uid, inode = self.DIAG_MSG_OWNER.unpack_from(payload, 64)
+                    if family == socket.AF_INET:
+                        local = f"{socket.inet_ntop(family, payload[8:12])}:{sport}"
+                        remote = f"{socket.inet_ntop(family, payload[24:28])}:{dport}"
+                    else:
+                        local = f"[{socket.inet_ntop(family, payload[8:24])}]:{sport}"
+                        remote = f"[{socket.inet_ntop(family, payload[24:40])}]:{dport}"
+                    code = f'{state:02X}'
+                    sockets.append({
+                        'proto': name,
+                        'local': local,
+                        'remote': remote,
+                        'state': self.SOCKET_STATES.get(code, code),
+                        'uid': uid,
+                        'inode': inode
+                    })
+        return sockets
+
+    def _netlink_dump(self, nl) -> Iterator[bytes]:
+        """Payloads of one netlink dump reply, up to its NLMSG_DONE"""
+        while True:
+            data = nl.recv(65536)
+            offset = 0
+            while offset + self.NLMSG_HDR.size <= len(data):
+                length, msg_type, _, _, _ = self.NLMSG_HDR.unpack_from(data, offset)
+                if msg_type == self.NLMSG_DONE:
+                    return
+                if msg_type == self.NLMSG_ERROR:
+                    errno, = struct.unpack_from('=i', data, offset + self.NLMSG_HDR.size)
+                    if errno:
+                        raise OSError(-errno, os.strerror(-errno))
+                    return
+                yield data[offset + self.NLMSG_HDR.size:offset + length]
+                # Messages are padded to 4-byte boundaries
+                offset += (length + 3) & ~3
+
+    def _read_proc_sockets(self) -> List[Dict[str, Any]]:
+        """Active TCP and UDP sockets parsed from /proc/net"""
+        sockets = []
+        for proto in ('tcp', 'tcp6', 'udp', 'udp6'):
+            try:
+                f = open(f'/proc/net/{proto}')
+            except FileNotFoundError:
+                continue  # e.g. IPv6 disabled
+
+            with f:
+                next(f, None)  # Column headers
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 10:
+                        continue
+                    state = fields[3]
+                    if proto.startswith('tcp'):
+                        if state == self.TCP_LISTEN:
+                            continue
+                    elif state != self.UDP_CONNECTED:
+                        continue
+                    sockets.append({
+                        'proto': proto,
+                        'local': self._decode_proc_address(fields[1]),
+                        'remote': self._decode_proc_address(fields[2]),
+                        'state': self.SOCKET_STATES.get(state, state),
+                        'uid': int(fields[7]),
+                        'inode': int(fields[9])
+                    })
+        return sockets
+
+    @staticmethod
+    def _decode_proc_address(address: str) -> str:
+        """Turn a /proc/net 'HEXADDR:HEXPORT' pair into 'ip:port'"""
+        host, port = address.split(':')
+        # The address is stored as native-endian 32-bit words
+        packed = b''.join(
+            int(host[i:i + 8], 16).to_bytes(4, sys.byteorder)
+            for i in range(0, len(host), 8)
+        )
+        if len(packed) == 4:
+            return f"{socket.inet_ntop(socket.AF_INET, packed)}:{int(port, 16)}"
+        return f"[{socket.inet_ntop(socket.AF_INET6, packed)}]:{int(port, 16)}"
+
+    def _read_arp_table(self) -> List[Dict[str, str]]:
+        """IPv4 neighbours seen on the gadget interface, from /proc/net/arp"""
+        neighbours = []
+        with open('/proc/net/arp') as f:
+            next(f, None)  # Column headers
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 6 and fields[5] == self.gadget_interface:
+                    neighbours.append({
+                        'ip': fields[0],
+                        'mac': fields[3],
+                        'flags': fields[2]
+                    })
+        return neighbours
+
     def get_connection_info(self) -> Dict[str, Any]:
         """Get information about USB connection"""
         try:
@@ -72,13 +385,7 @@ class USBGadget:
 
             if info['connected']:
                 # Get interface statistics
-                result = subprocess.run(
-                    ['ip', '-s', 'link', 'show', self.gadget_interface],
-                    capture_output=True,
-                    text=True
-                )
-                if result.returncode == 0:
-                    info['interface_stats'] = result.stdout
+                info['interface_stats'] = self._read_interface_stats()
 
             return info
         except Exception as e:
@@ -90,23 +397,51 @@ class USBGadget:
         self.logger.info("Configuring USB network interface")
 
         try:
-            commands = [
+            try:
+                index = socket.if_nametoindex(self.gadget_interface)
+            except OSError:
+                raise Exception(f"Interface {self.gadget_interface} not found")
+
+            device_ip = socket.inet_aton(self.device_ip)
+            requests = [
                 # Bring up interface
-                ['ip', 'link', 'set', self.gadget_interface, 'up'],
+                ('link set up', self.RTM_NEWLINK, 0,
+                 self.IFINFO_MSG.pack(socket.AF_UNSPEC, 0, index, self.IFF_UP, self.IFF_UP)),
                 # Set IP address
-                ['ip', 'addr', 'add', f'{self.device_ip}/24', 'dev', self.gadget_interface],
+                ('addr add', self.RTM_NEWADDR, self.NLM_F_CREATE | self.NLM_F_EXCL,
+                 self.IFADDR_MSG.pack(socket.AF_INET, 24, 0, 0, index)
+                 + self._rtattr(self.IFA_LOCAL, device_ip)
+                 + self._rtattr(self.IFA_ADDRESS, device_ip)),
                 # Add route to host
-                ['ip', 'route', 'add', self.host_ip, 'dev', self.gadget_interface],
+                ('route add', self.RTM_NEWROUTE, self.NLM_F_CREATE | self.NLM_F_EXCL,
+                 self.RT_MSG.pack(socket.AF_INET, 32, 0, 0, self.RT_TABLE_MAIN, self.RTPROT_BOOT,
+                                  self.RT_SCOPE_LINK, self.RTN_UNICAST, 0)
+                 + self._rtattr(self.RTA_DST, socket.inet_aton(self.host_ip))
+                 + self._rtattr(self.RTA_OIF, struct.pack('=I', index))),
             ]
 
-            for cmd in commands:
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode != 0:
-                    self.logger.warning(f"Command failed: {' '.join(cmd)}: {result.stderr}")
-
-            # Enable IP forwarding
-            with open('/proc/sys/net/ipv4/ip_forward', 'w') as f:
-                f.write('1')
+            # Apply all three over one rtnetlink socket, without running
+            # `ip`; like `ip -force`, a failing step (e.g. an address that
+            # is already assigned) is logged and the rest still run
+            with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE) as nl:
+                for seq, (step, msg_type, flags, body) in enumerate(requests, 1):
+                    nl.send(self.NLMSG_HDR.pack(
+                        self.NLMSG_HDR.size + len(body), msg_type,
+                        self.NLM_F_REQUEST | self.NLM_F_ACK | flags, seq, 0
+                    ) + body)
+                    try:
+                        # The reply is a bare acknowledgement
+                        for _ in self._netlink_dump(nl):
+                            pass
+                    except OSError as e:
+                        self.logger.warning(f"Network setup '{step}' failed: {e}")
+
+            # Enable IP forwarding. Writing the knob re-applies forwarding
+            # to every interface, so leave it alone when already enabled
+            if self._sysctl_read('/proc/sys/net/ipv4/ip_forward') != b'1':
+                self._sysctl_write('/proc/sys/net/ipv4/ip_forward', b'1')
+
+            self._invalidate_probes()
 
             self.logger.info("USB network configured successfully")
 
@@ -121,39 +456,213 @@ class USBGadget:
             self.logger.error(f"Network configuration failed: {e}")
             return {'success': False, 'error': str(e)}
 
-    def start_packet_capture(self, output_file: str = None) -> Dict[str, Any]:
-        """Start capturing traffic on USB interface"""
+    def _rtattr(self, attr_type: int, data: bytes) -> bytes:
+        """Encode one netlink route attribute, padded to 4 bytes"""
+        header = self.RT_ATTR.pack(self.RT_ATTR.size + len(data), attr_type)
+        return header + data + b'\0' * (-len(data) % 4)
+
+    @staticmethod
+    def _stderr_text(result) -> str:
+        """Decode a finished command's captured stderr for a message"""
+        return result.stderr.decode(errors='replace').strip()
+
+    def _sysctl_read(self, path: str) -> bytes:
+        """Read a procfs/sysfs knob with a single read()"""
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            return os.read(fd, 64).strip()
+        finally:
+            os.close(fd)
+
+    def _sysctl_write(self, path: str, value: bytes) -> None:
+        """Write a value to a procfs/sysfs/configfs knob with a single write()"""
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            os.write(fd, value)
+        finally:
+            os.close(fd)
+
+    def start_packet_capture(self, output_file: str = None, duration: Optional[int] = None,
+                             max_bytes: Optional[int] = None) -> Dict[str, Any]:
+        """Start capturing traffic on USB interface
+
+        The capture ends after duration seconds or max_bytes of packet data,
+        defaulting to the configured bounds, or when stop_packet_capture is called.
+        """
+        if duration is None:
+            duration = self.capture_duration
+        if max_bytes is None:
+            max_bytes = self.capture_max_bytes
+
         if output_file is None:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             output_file = f"usb_capture_{timestamp}.pcap"
 
-        output_path = os.path.join(self.output_dir, output_file)
+        # The name may come from a web client: keep only its final component
+        # and refuse anything that still resolves outside output_dir
+        output_name = os.path.basename(output_file)
+        output_path = os.path.join(self.output_dir, output_name)
+        output_root = os.path.realpath(self.output_dir)
+        if output_name in ('', '.', '..') or \
+                os.path.dirname(os.path.realpath(output_path)) != output_root:
+            return {'success': False, 'error': f'Invalid capture file name: {output_file}'}
 
         self.logger.info(f"Starting USB packet capture: {output_path}")
 
-        try:
-            # Start tcpdump in background
-            tcpdump_cmd = [
-                'tcpdump',
-                '-i', self.gadget_interface,
-                '-w', output_path,
-                '-n'  # Don't resolve hostnames
-            ]
+        if self._capture_thread is not None and self._capture_thread.is_alive():
+            return {'success': False, 'error': 'A USB packet capture is already running'}
 
-            # This would run in background in production
-            self.logger.info(f"Capture command: {' '.join(tcpdump_cmd)}")
+        sock = ring = None
+        fd = -1
+        try:
+            # Capture in-process from an AF_PACKET socket with a TPACKET_V3
+            # receive ring: the kernel fills whole blocks of frames in memory
+            # shared with us, so there is no copy or syscall per packet
+            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(self.ETH_P_ALL))
+            sock.setsockopt(self.SOL_PACKET, self.PACKET_VERSION, self.TPACKET_V3)
+            block_size, block_count = self.capture_block_size, self.capture_block_count
+            ring_size = block_size * block_count
+            sock.setsockopt(self.SOL_PACKET, self.PACKET_RX_RING, self.RING_REQ.pack(
+                block_size, block_count, self.RING_FRAME_SIZE,
+                ring_size // self.RING_FRAME_SIZE,
+                self.capture_retire_ms, 0, 0
+            ))
+            ring = mmap.mmap(sock.fileno(), ring_size,
+                             mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            sock.bind((self.gadget_interface, self.ETH_P_ALL))
+
+            fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o644)
+            self._write_all(fd, self.PCAP_HEADER)
+
+            self._capture_stop = threading.Event()
+            self._capture_stats = {'output_file': output_path, 'packets': 0, 'bytes': 0}
+            deadline = time.monotonic() + duration if duration else None
+            self._capture_thread = threading.Thread(
+                target=self._ring_capture,
+                args=(sock, ring, block_size, block_count, fd,
+                      self._capture_stop, self._capture_stats, deadline, max_bytes),
+                name='usb-capture',
+                daemon=True
+            )
+            self._capture_thread.start()
 
             return {
                 'success': True,
                 'output_file': output_path,
                 'interface': self.gadget_interface,
-                'command': ' '.join(tcpdump_cmd)
+                'ring_size_mb': ring_size >> 20,
+                'duration': duration,
+                'max_bytes': max_bytes
             }
 
         except Exception as e:
             self.logger.error(f"Packet capture failed: {e}")
+            if ring is not None:
+                ring.close()
+            if sock is not None:
+                sock.close()
+            if fd >= 0:
+                os.close(fd)
+            return {'success': False, 'error': str(e)}
+
+    def _ring_capture(self, sock, ring, block_size: int, block_count: int, fd: int,
+                      stop, stats: Dict[str, Any], deadline: Optional[float] = None,
+                      max_bytes: int = 0) -> None:
+        """Drain retired ring blocks into the pcap file until asked to stop,
+        the deadline passes or max_bytes of packet data are written"""
+        poller = select.poll()
+        poller.register(sock, select.POLLIN | select.POLLERR)
+        view = memoryview(ring)
+        chunks = []
+        block = 0
+        draining = False
+
+        try:
+            while True:
+                base = block * block_size
+                status, num_pkts, offset = self.BLOCK_HDR.unpack_from(ring, base + 8)
+                if not status & self.TP_STATUS_USER:
+                    if draining:
+                        break
+                    if stop.is_set() or (deadline is not None and time.monotonic() >= deadline):
+                        # Give the kernel time to retire the partly filled
+                        # block, then write out whatever it handed over
+                        stats.setdefault('stopped', 'requested' if stop.is_set() else 'duration')
+                        draining = True
+                        poller.poll(self.capture_retire_ms * 2)
+                        continue
+                    # Wake periodically so a stop request is noticed
+                    poller.poll(250)
+                    continue
+
+                # Gather the whole block and write it with one syscall
+                chunks.clear()
+                pkt = base + offset
+                for _ in range(num_pkts):
+                    next_offset, sec, nsec, snaplen, wire_len, _, mac = self.FRAME_HDR.unpack_from(ring, pkt)
+                    chunks.append(self.PCAP_RECORD.pack(sec, nsec, snaplen, wire_len))
+                    chunks.append(view[pkt + mac:pkt + mac + snaplen])
+                    stats['bytes'] += snaplen
+                    pkt += next_offset
+                data = b''.join(chunks)
+                chunks.clear()
+
+                # Hand the block back to the kernel as soon as its frames are
+                # copied out, before the disk write, so the ring never waits
+                # on storage for a free block
+                self.BLOCK_STATUS.pack_into(ring, base + 8, self.TP_STATUS_KERNEL)
+                block = (block + 1) % block_count
+
+                self._write_all(fd, data)
+                stats['packets'] += num_pkts
+
+                if max_bytes and stats['bytes'] >= max_bytes:
+                    stats['stopped'] = 'max_bytes'
+                    break
+
+        except Exception as e:
+            self.logger.error(f"Packet capture stopped: {e}")
+            stats['error'] = str(e)
+
+        finally:
+            # Drop slices of the ring before unmapping it
+            chunks.clear()
+            view.release()
+            ring.close()
+            sock.close()
+            os.close(fd)
+
+    def _write_all(self, fd: int, data: bytes) -> None:
+        """Write a buffer in full, resuming after short writes"""
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+    def stop_packet_capture(self) -> Dict[str, Any]:
+        """Stop the background USB packet capture, or collect the results of
+        one that already reached its duration or size bound"""
+        if self._capture_thread is None:
+            return {'success': False, 'error': 'No USB packet capture is running'}
+
+        self.logger.info("Stopping USB packet capture")
+
+        try:
+            self._capture_stop.set()
+            self._capture_thread.join(timeout=5)
+            if self._capture_thread.is_alive():
+                return {'success': False, 'error': 'USB packet capture did not stop in time'}
+
+            self._capture_thread = None
+            return {'success': True, **self._capture_stats}
+
+        except Exception as e:
+            self.logger.error(f"Failed to stop packet capture: {e}")
             return {'success': False, 'error': str(e)}
 
+    def _stop_capture_at_exit(self) -> None:
+        if self._capture_thread is not None and self._capture_thread.is_alive():
+            self.stop_packet_capture()
+
     def monitor_host_activity(self) -> Dict[str, Any]:
         """Monitor activity from connected host PC"""
         self.logger.info("Monitoring host PC activity")
@@ -167,25 +676,10 @@ class USBGadget:
             }
 
             # Get active connections
-            result = subprocess.run(
-                ['ss', '-tupn'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-
-            if result.returncode == 0:
-                activity['connections'] = result.stdout.strip().split('\n')
+            activity['connections'] = self._read_sockets()
 
             # Monitor ARP table to see host MAC
-            result = subprocess.run(
-                ['ip', 'neigh', 'show', 'dev', self.gadget_interface],
-                capture_output=True,
-                text=True
-            )
-
-            if result.returncode == 0:
-                activity['arp_table'] = result.stdout.strip().split('\n')
+            activity['arp_table'] = self._read_arp_table()
 
             return activity
 
@@ -204,16 +698,18 @@ class USBGadget:
                 'detected_services': []
             }
 
+            if self._bin['nmap'] is None:
+                host_info['error'] = 'nmap is not installed'
+                return host_info
+
             # Scan host for open ports (quick scan)
             nmap_cmd = [
-                'nmap',
+                self._bin['nmap'],
                 '-F',  # Fast scan
                 '-T4', # Aggressive timing
                 self.host_ip
             ]
 
-            # Note: This requires nmap to be installed
-            # In production, we'd check if available first
             self.logger.info(f"Scanning host: {' '.join(nmap_cmd)}")
 
             return host_info
@@ -227,19 +723,37 @@ class USBGadget:
         self.logger.info("Enabling MITM mode")
 
         try:
-            # Set up iptables for traffic interception
+            # Forwarding stays in the kernel: NAT and REDIRECT hand the
+            # intercepted flows to the local proxies on 8080/8443, so no
+            # packet passes through this process and there is no userspace
+            # transmit path to batch
+            # Set up iptables for traffic interception (nat table)
             iptables_rules = [
                 # Enable NAT
-                ['iptables', '-t', 'nat', '-A', 'POSTROUTING', '-o', 'wlan0', '-j', 'MASQUERADE'],
+                ['-A', 'POSTROUTING', '-o', 'wlan0', '-j', 'MASQUERADE'],
                 # Redirect HTTP traffic
-                ['iptables', '-t', 'nat', '-A', 'PREROUTING', '-i', self.gadget_interface, '-p', 'tcp', '--dport', '80', '-j', 'REDIRECT', '--to-port', '8080'],
+                ['-A', 'PREROUTING', '-i', self.gadget_interface, '-p', 'tcp', '--dport', '80', '-j', 'REDIRECT', '--to-port', '8080'],
                 # Redirect HTTPS for inspection (requires SSL interception)
-                ['iptables', '-t', 'nat', '-A', 'PREROUTING', '-i', self.gadget_interface, '-p', 'tcp', '--dport', '443', '-j', 'REDIRECT', '--to-port', '8443'],
+                ['-A', 'PREROUTING', '-i', self.gadget_interface, '-p', 'tcp', '--dport', '443', '-j', 'REDIRECT', '--to-port', '8443'],
             ]
 
-            for rule in iptables_rules:
-                self.logger.info(f"Applying rule: {' '.join(rule)}")
-                # In production, we'd actually execute these
+            # Apply all rules in one iptables-restore transaction instead of
+            # one iptables process (and xtables lock round-trip) per rule;
+            # --noflush appends to the existing nat table
+            batch = '\n'.join(['*nat', *(' '.join(rule) for rule in iptables_rules), 'COMMIT', ''])
+            self.logger.info(f"Applying rules with iptables-restore --noflush:\n{batch}")
+
+            result = subprocess.run(
+                [self._tool('iptables-restore'), '--noflush'],
+                input=batch.encode(),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                timeout=30
+            )
+            if result.returncode != 0:
+                raise Exception(f"iptables-restore failed: {self._stderr_text(result)}")
+
+            self._invalidate_probes()
 
             return {
                 'success': True,
@@ -286,6 +800,14 @@ class USBGadget:
                 'result': activity_result
             })
 
+            # 4. Let the capture run to its duration bound, then close it
+            if capture_result.get('success'):
+                self._capture_thread.join(capture_result['duration'] or None)
+                collection_info['tasks'].append({
+                    'task': 'stop_packet_capture',
+                    'result': self.stop_packet_capture()
+                })
+
             self.logger.info(f"Auto-collection started: {case_id}")
 
             return collection_info
@@ -307,16 +829,8 @@ class USBGadget:
             }
 
             # Check kernel modules
-            result = subprocess.run(
-                ['lsmod'],
-                capture_output=True,
-                text=True
-            )
-
-            loaded_modules = []
-            for line in result.stdout.split('\n'):
-                if 'g_ether' in line or 'g_multi' in line or 'dwc2' in line:
-                    loaded_modules.append(line.split()[0])
+            search = self.GADGET_MODULE_PATTERN.search
+            loaded_modules = [module for module in self._loaded_modules() if search(module)]
 
             status['loaded_modules'] = loaded_modules
 
@@ -342,19 +856,18 @@ class USBGadget:
 
     def is_mass_storage_available(self) -> bool:
         """Check if mass storage gadget is available"""
+        # Check if backing file exists
+        return self._is_mass_storage_available(os.path.exists(self.mass_storage_file))
+
+    def _is_mass_storage_available(self, backing_file_exists: bool) -> bool:
+        """Check mass storage availability given whether the backing file exists"""
         try:
-            # Check if backing file exists
-            if not os.path.exists(self.mass_storage_file):
+            if not backing_file_exists:
                 return False
 
             # Check if mass storage is exposed via g_multi or g_mass_storage
-            result = subprocess.run(
-                ['lsmod'],
-                capture_output=True,
-                text=True
-            )
-
-            return 'g_multi' in result.stdout or 'g_mass_storage' in result.stdout
+            modules = self._loaded_modules()
+            return 'g_multi' in modules or 'g_mass_storage' in modules
 
         except Exception as e:
             self.logger.error(f"Failed to check mass storage: {e}")
@@ -379,32 +892,25 @@ class USBGadget:
             os.makedirs(storage_dir, exist_ok=True)
             os.makedirs(self.mass_storage_mount, exist_ok=True)
 
-            # Create sparse file
+            # Preallocate the backing file; the filesystem reserves zeroed
+            # extents without any data being written through userspace
             self.logger.info(f"Creating backing file: {self.mass_storage_file}")
-            result = subprocess.run(
-                ['dd', 'if=/dev/zero', f'of={self.mass_storage_file}',
-                 'bs=1M', f'count={size_mb}', 'status=progress'],
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
-
-            if result.returncode != 0:
-                raise Exception(f"Failed to create backing file: {result.stderr}")
+            self._preallocate(self.mass_storage_file, size_mb * 1024 * 1024)
 
             # Format with filesystem
             self.logger.info(f"Formatting with {filesystem}")
             if filesystem == 'vfat':
-                mkfs_cmd = ['mkfs.vfat', '-n', 'VIVISECT', self.mass_storage_file]
+                mkfs_cmd = [self._tool('mkfs.vfat'), '-n', 'VIVISECT', self.mass_storage_file]
             elif filesystem == 'ext4':
-                mkfs_cmd = ['mkfs.ext4', '-L', 'VIVISECT', '-F', self.mass_storage_file]
+                mkfs_cmd = [self._tool('mkfs.ext4'), '-L', 'VIVISECT', '-F', self.mass_storage_file]
             else:
                 raise Exception(f"Unsupported filesystem: {filesystem}")
 
-            result = subprocess.run(mkfs_cmd, capture_output=True, text=True, timeout=60)
+            result = subprocess.run(mkfs_cmd, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, timeout=60)
 
             if result.returncode != 0:
-                raise Exception(f"Failed to format: {result.stderr}")
+                raise Exception(f"Failed to format: {self._stderr_text(result)}")
 
             self.logger.info("Mass storage image created successfully")
 
@@ -420,6 +926,20 @@ class USBGadget:
             self.logger.error(f"Mass storage creation failed: {e}")
             return {'success': False, 'error': str(e)}
 
+    def _preallocate(self, path: str, size: int) -> None:
+        """Create a file of the given size, preallocated where supported"""
+        fd = os.open(path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+        try:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except (AttributeError, OSError) as e:
+                # No fallocate on this platform or filesystem; a sparse file
+                # of the right length works just as well for mkfs
+                self.logger.info(f"Preallocation unavailable ({e}), creating sparse file")
+                os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+
     def mount_mass_storage(self) -> Dict[str, Any]:
         """Mount mass storage image for writing reports"""
         self.logger.info("Mounting mass storage image")
@@ -433,13 +953,13 @@ class USBGadget:
 
             # Mount the image
             result = subprocess.run(
-                ['mount', '-o', 'loop', self.mass_storage_file, self.mass_storage_mount],
-                capture_output=True,
-                text=True
+                [self._tool('mount'), '-o', 'loop', self.mass_storage_file, self.mass_storage_mount],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
             )
 
             if result.returncode != 0:
-                raise Exception(f"Mount failed: {result.stderr}")
+                raise Exception(f"Mount failed: {self._stderr_text(result)}")
 
             self.logger.info(f"Mounted at {self.mass_storage_mount}")
 
@@ -459,13 +979,13 @@ class USBGadget:
 
         try:
             result = subprocess.run(
-                ['umount', self.mass_storage_mount],
-                capture_output=True,
-                text=True
+                [self._tool('umount'), self.mass_storage_mount],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
             )
 
             if result.returncode != 0:
-                self.logger.warning(f"Unmount warning: {result.stderr}")
+                self.logger.warning(f"Unmount warning: {self._stderr_text(result)}")
 
             return {'success': True}
 
@@ -483,35 +1003,23 @@ class USBGadget:
             if not mount_result.get('success'):
                 return mount_result
 
+            written = []
+
             # Copy reports
             reports_dir = os.path.join(self.output_dir, 'reports')
             if os.path.exists(reports_dir):
                 self.logger.info(f"Copying reports from {reports_dir}")
-                result = subprocess.run(
-                    ['rsync', '-av', '--update', f'{reports_dir}/',
-                     f'{self.mass_storage_mount}/reports/'],
-                    capture_output=True,
-                    text=True,
-                    timeout=300
-                )
-
-                if result.returncode != 0:
-                    self.logger.warning(f"Rsync warning: {result.stderr}")
+                written += self._copy_tree(reports_dir, os.path.join(self.mass_storage_mount, 'reports'))
 
             # Copy evidence metadata
             evidence_dir = os.path.join(self.output_dir, 'evidence')
             if os.path.exists(evidence_dir):
                 self.logger.info(f"Copying evidence metadata from {evidence_dir}")
-                result = subprocess.run(
-                    ['rsync', '-av', '--update', '--exclude', '*.img', '--exclude', '*.dd',
-                     f'{evidence_dir}/', f'{self.mass_storage_mount}/evidence/'],
-                    capture_output=True,
-                    text=True,
-                    timeout=300
-                )
+                written += self._copy_tree(evidence_dir, os.path.join(self.mass_storage_mount, 'evidence'),
+                                           exclude=('*.img', '*.dd'))
 
-            # Sync filesystem
-            subprocess.run(['sync'], timeout=30)
+            # Flush only what was written here, not every dirty page on the system
+            self._flush_written(written)
 
             # Unmount
             self.unmount_mass_storage()
@@ -521,6 +1029,7 @@ class USBGadget:
             return {
                 'success': True,
                 'synced_dirs': ['reports', 'evidence'],
+                'files_copied': len(written),
                 'mount_point': self.mass_storage_mount
             }
 
@@ -533,6 +1042,59 @@ class USBGadget:
                 pass
             return {'success': False, 'error': str(e)}
 
+    def _flush_written(self, paths: List[str]) -> None:
+        """fdatasync copied files, then fsync their directories so the new
+        entries are durable too"""
+        directories = {self.mass_storage_mount}
+        for path in paths:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fdatasync(fd)
+            finally:
+                os.close(fd)
+            directories.add(os.path.dirname(path))
+
+        for directory in directories:
+            fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _copy_tree(self, src: str, dst: str, exclude: tuple = ()) -> List[str]:
+        """Copy new and updated files from src into dst, like `rsync -a --update`;
+        returns the paths written"""
+        written = []
+        os.makedirs(dst, exist_ok=True)
+
+        with os.scandir(src) as entries:
+            for entry in entries:
+                if any(fnmatch.fnmatch(entry.name, pattern) for pattern in exclude):
+                    continue
+                target = os.path.join(dst, entry.name)
+
+                if entry.is_dir(follow_symlinks=False):
+                    written += self._copy_tree(entry.path, target, exclude)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        src_stat = entry.stat(follow_symlinks=False)
+                        try:
+                            # Skip files the target already has at least as new
+                            if os.stat(target).st_mtime_ns + self.MTIME_WINDOW_NS > src_stat.st_mtime_ns:
+                                continue
+                        except FileNotFoundError:
+                            pass
+
+                        # copyfile moves the data with the kernel's sendfile
+                        # path on Linux, without a userspace read/write loop
+                        shutil.copyfile(entry.path, target)
+                        os.utime(target, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+                        written.append(target)
+                    except OSError as e:
+                        self.logger.warning(f"Failed to copy {entry.path}: {e}")
+
+        return written
+
     def get_serial_console_info(self) -> Dict[str, Any]:
         """Get serial console information"""
         try:
@@ -542,15 +1104,15 @@ class USBGadget:
                 'baud_rate': 115200
             }
 
-            if info['available']:
+            if info['available'] and self._bin['stty'] is not None:
                 # Check if anything is connected
                 result = subprocess.run(
-                    ['stty', '-F', self.serial_device],
-                    capture_output=True,
-                    text=True
+                    [self._bin['stty'], '-F', self.serial_device],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL
                 )
                 if result.returncode == 0:
-                    info['settings'] = result.stdout.strip()
+                    info['settings'] = result.stdout.decode(errors='replace').strip()
 
             return info
 
@@ -561,44 +1123,36 @@ class USBGadget:
     def get_multifunction_status(self) -> Dict[str, Any]:
         """Get comprehensive multi-function gadget status"""
         try:
+            # One stat answers both existence and size of the backing file
+            try:
+                backing_stat = os.stat(self.mass_storage_file)
+            except OSError:
+                backing_stat = None
+
+            functions = {name: fields.copy() for name, fields in self._status_functions.items()}
             status = {
                 'mode': self.gadget_mode,
                 'timestamp': datetime.now().isoformat(),
-                'functions': {
-                    'network': {
-                        'enabled': self.is_gadget_enabled(),
-                        'connected': self.is_connected_to_host(),
-                        'interface': self.gadget_interface,
-                        'device_ip': self.device_ip,
-                        'host_ip': self.host_ip
-                    },
-                    'mass_storage': {
-                        'available': self.is_mass_storage_available(),
-                        'backing_file': self.mass_storage_file,
-                        'backing_file_exists': os.path.exists(self.mass_storage_file),
-                        'mount_point': self.mass_storage_mount
-                    },
-                    'serial': {
-                        'available': self.is_serial_available(),
-                        'device': self.serial_device
-                    }
-                }
+                'functions': functions
             }
 
+            network = functions['network']
+            network['enabled'] = self.is_gadget_enabled()
+            network['connected'] = self.is_connected_to_host()
+
+            mass_storage = functions['mass_storage']
+            mass_storage['available'] = self._is_mass_storage_available(backing_stat is not None)
+            mass_storage['backing_file_exists'] = backing_stat is not None
+
             # Get backing file size if it exists
-            if status['functions']['mass_storage']['backing_file_exists']:
-                try:
-                    size_bytes = os.path.getsize(self.mass_storage_file)
-                    status['functions']['mass_storage']['size_mb'] = size_bytes // (1024 * 1024)
-                except:
-                    pass
+            if backing_stat is not None:
+                mass_storage['size_mb'] = backing_stat.st_size // (1024 * 1024)
+
+            functions['serial']['available'] = self.is_serial_available()
 
             # Check what's actually loaded
-            result = subprocess.run(['lsmod'], capture_output=True, text=True)
-            loaded_modules = []
-            for line in result.stdout.split('\n'):
-                if any(mod in line for mod in ['g_ether', 'g_multi', 'g_serial', 'g_mass_storage', 'usb_f_', 'dwc2']):
-                    loaded_modules.append(line.split()[0])
+            search = self.FUNCTION_MODULE_PATTERN.search
+            loaded_modules = [module for module in self._loaded_modules() if search(module)]
 
             status['loaded_modules'] = loaded_modules
 
@@ -641,7 +1195,7 @@ class USBGadget:
             # Load g_mass_storage module
             ro_flag = '1' if read_only else '0'
             modprobe_cmd = [
-                'modprobe', 'g_mass_storage',
+                self._tool('modprobe'), 'g_mass_storage',
                 f'file={self.mass_storage_file}',
                 f'removable=1',
                 f'ro={ro_flag}',
@@ -652,10 +1206,12 @@ class USBGadget:
             ]
 
             self.logger.info(f"Loading g_mass_storage: {' '.join(modprobe_cmd)}")
-            result = subprocess.run(modprobe_cmd, capture_output=True, text=True, timeout=10)
+            result = subprocess.run(modprobe_cmd, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, timeout=10)
+            self._invalidate_probes()
 
             if result.returncode != 0:
-                raise Exception(f"Failed to load g_mass_storage: {result.stderr}")
+                raise Exception(f"Failed to load g_mass_storage: {self._stderr_text(result)}")
 
             # Update mode
             self.gadget_mode = 'mass_storage'
@@ -692,7 +1248,7 @@ class USBGadget:
 
             # Load g_multi module
             modprobe_cmd = [
-                'modprobe', 'g_multi',
+                self._tool('modprobe'), 'g_multi',
                 f'file={self.mass_storage_file}',
                 'removable=1',
                 'ro=0',
@@ -703,10 +1259,12 @@ class USBGadget:
             ]
 
             self.logger.info(f"Loading g_multi: {' '.join(modprobe_cmd)}")
-            result = subprocess.run(modprobe_cmd, capture_output=True, text=True, timeout=10)
+            result = subprocess.run(modprobe_cmd, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, timeout=10)
+            self._invalidate_probes()
 
             if result.returncode != 0:
-                raise Exception(f"Failed to load g_multi: {result.stderr}")
+                raise Exception(f"Failed to load g_multi: {self._stderr_text(result)}")
 
             # Update mode
             self.gadget_mode = 'multi'
@@ -743,17 +1301,19 @@ class USBGadget:
 
             # Load g_ether module
             modprobe_cmd = [
-                'modprobe', 'g_ether',
+                self._tool('modprobe'), 'g_ether',
                 'iSerialNumber=VIVISECT001',
                 'iManufacturer=Vivisect',
                 'iProduct=Forensics Network Adapter'
             ]
 
             self.logger.info(f"Loading g_ether: {' '.join(modprobe_cmd)}")
-            result = subprocess.run(modprobe_cmd, capture_output=True, text=True, timeout=10)
+            result = subprocess.run(modprobe_cmd, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, timeout=10)
+            self._invalidate_probes()
 
             if result.returncode != 0:
-                raise Exception(f"Failed to load g_ether: {result.stderr}")
+                raise Exception(f"Failed to load g_ether: {self._stderr_text(result)}")
 
             # Update mode
             self.gadget_mode = 'ether'
@@ -783,12 +1343,13 @@ class USBGadget:
 
         try:
             modules_to_unload = ['g_multi', 'g_ether', 'g_serial', 'g_mass_storage']
+            modprobe = self._tool('modprobe')
 
             for module in modules_to_unload:
                 result = subprocess.run(
-                    ['modprobe', '-r', module],
-                    capture_output=True,
-                    text=True,
+                    [modprobe, '-r', module],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
                     timeout=5
                 )
                 # Don't fail if module wasn't loaded
@@ -797,6 +1358,7 @@ class USBGadget:
 
             # Wait for cleanup
             time.sleep(1)
+            self._invalidate_probes()
 
             return {'success': True}
 
@@ -807,15 +1369,15 @@ class USBGadget:
     def get_current_mode(self) -> str:
         """Get current USB gadget mode"""
         try:
-            result = subprocess.run(['lsmod'], capture_output=True, text=True)
+            modules = self._loaded_modules()
 
-            if 'g_multi' in result.stdout:
+            if 'g_multi' in modules:
                 return 'multi'
-            elif 'g_ether' in result.stdout:
+            elif 'g_ether' in modules:
                 return 'ether'
-            elif 'g_serial' in result.stdout:
+            elif 'g_serial' in modules:
                 return 'serial'
-            elif 'g_mass_storage' in result.stdout:
+            elif 'g_mass_storage' in modules:
                 return 'mass_storage'
             else:
                 return 'none'
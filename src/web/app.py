@@ -1,13 +1,30 @@
 """Flask application for Vivisect Web GUI"""
 
+import io
 import os
 import sys
 import json
+import time
 from datetime import datetime
 from flask import Flask, render_template, jsonify, request, send_file
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.security import safe_join
 from flask_socketio import SocketIO, emit
+from concurrent.futures import ThreadPoolExecutor
 import threading
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    from flask_compress import Compress
+    HAS_COMPRESS = True
+except ImportError:
+    HAS_COMPRESS = False
+
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -21,16 +38,129 @@ from modules import (
     USBGadget
 )
 
+def tail_lines(path: str, n: int = 100, block_size: int = 8192) -> list:
+    """Return the last n lines of a file, reading blocks backwards from its end"""
+    # Unbuffered, since every read is already a whole block we seeked to
+    with open(path, 'rb', buffering=0) as f:
+        pos = f.seek(0, os.SEEK_END)
+        chunks = []
+        newlines = 0
+        # n + 1 newlines guarantee the first of the last n lines is complete
+        while pos > 0 and newlines <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b'\n')
+
+    lines = io.BytesIO(b''.join(reversed(chunks))).readlines()[-n:]
+    return [line.decode('utf-8', errors='replace') for line in lines]
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson, falling back to the
+    default provider for values orjson rejects (e.g. integers over 64 bits)"""
+
+    def _encode(self, obj, option: int = 0, **kwargs) -> bytes:
+        option |= orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            if option & orjson.OPT_INDENT_2:
+                kwargs.setdefault('indent', 2)
+            else:
+                kwargs.setdefault('separators', (',', ':'))
+            data = super().dumps(obj, **kwargs).encode('utf-8')
+            return data + b'\n' if option & orjson.OPT_APPEND_NEWLINE else data
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self._encode(obj, **kwargs).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes to the response without a str round trip;
+        # indentation and the trailing newline match the default provider
+        obj = self._prepare_response_obj(args, kwargs)
+        option = orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(self._encode(obj, option=option), mimetype=self.mimetype)
+
+class ProgressThrottle:
+    """Emits progress events at most once per interval, keeping the latest;
+    a held update is flushed by a timer once the interval has passed"""
+
+    def __init__(self, app, socketio, interval: float = 0.1):
+        self.app = app
+        self.socketio = socketio
+        self.interval = interval
+        self._pending = None
+        self._last_emit = float('-inf')
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def push(self, progress: dict) -> None:
+        """Emit now, or hold the update if one went out within the interval"""
+        with self._lock:
+            self._pending = progress
+            wait = self.interval - (time.monotonic() - self._last_emit)
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        """Emit the held update, if any"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending is None:
+                return
+            progress, self._pending = self._pending, None
+            self._last_emit = time.monotonic()
+            with self.app.app_context():
+                self.socketio.emit('progress', progress, namespace='/')
+
 def create_app():
     """Create and configure Flask application"""
     app = Flask(__name__)
     app.config['SECRET_KEY'] = os.urandom(24)
+    if HAS_ORJSON:
+        app.json = OrjsonProvider(app)
+    if HAS_COMPRESS:
+        # Compress API and page responses for clients that accept it;
+        # bodies under 1 KiB are not worth the framing
+        app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/plain', 'text/html']
+        app.config['COMPRESS_LEVEL'] = 4
+        app.config['COMPRESS_MIN_SIZE'] = 1024
+        Compress(app)
     socketio = SocketIO(app, cors_allowed_origins="*")
 
     # Initialize Vivisect components
     config = Config()
-    logger = ForensicsLogger(config.get('log_dir'))
-    report_gen = ReportGenerator(config.get('output_dir'))
+
+    # Behind nginx/apache, let the proxy send report files itself
+    app.config['USE_X_SENDFILE'] = config.get('web.use_x_sendfile', False)
+    # The web app never changes its configuration, so the values the
+    # routes read are looked up once here rather than on every request
+    output_dir = config.get('output_dir')
+    log_dir = config.get('log_dir')
+    modules_enabled = {
+        name: config.get(f'modules.{name}.enabled', True)
+        for name in ('disk_imaging', 'file_analysis', 'network_forensics',
+                     'memory_analysis', 'artifact_extraction', 'usb_gadget')
+    }
+
+    logger = ForensicsLogger(log_dir)
+    report_gen = ReportGenerator(output_dir)
 
     # Initialize modules
     disk_imaging = DiskImaging(logger, config)
@@ -40,9 +170,62 @@ def create_app():
     artifact_extraction = ArtifactExtraction(logger, config)
     usb_gadget = USBGadget(logger, config)
 
-    # Store active tasks
+    # Background tasks run on a bounded pool; active_tasks holds the
+    # futures of queued and running tasks until they finish
+    task_workers = max(2, os.cpu_count() or 1)
+    executor = ThreadPoolExecutor(max_workers=task_workers,
+                                  thread_name_prefix='vivisect-task')
     active_tasks = {}
 
+    # Tasks that must not run twice at once: name -> id of the running task
+    exclusive_tasks = {}
+    exclusive_lock = threading.Lock()
+
+    def json_body() -> dict:
+        """Parse the request's JSON body, treating an empty body as {}"""
+        # Parsed straight from the raw bytes (with orjson when available)
+        # and without keeping a cached copy of the body on the request
+        raw = request.get_data(cache=False)
+        return app.json.loads(raw) if raw else {}
+
+    def start_task(task_id, target, exclusive=None):
+        """Queue a background task and track it until it completes.
+
+        Returns (task_id, status): 'started', or 'queued' when every worker
+        is busy. With an exclusive name, nothing is queued while a task of
+        that name is still running; its id and 'already_running' are
+        returned instead."""
+        if exclusive is not None:
+            with exclusive_lock:
+                running_id = exclusive_tasks.get(exclusive)
+                if running_id is not None:
+                    return running_id, 'already_running'
+                exclusive_tasks[exclusive] = task_id
+
+        def finished(future):
+            active_tasks.pop(task_id, None)
+            if exclusive is not None:
+                with exclusive_lock:
+                    exclusive_tasks.pop(exclusive, None)
+
+            # Tasks report their own results; anything that escaped them
+            # would otherwise vanish with the future
+            exc = future.exception()
+            if exc is not None:
+                logger.get_logger('web').error(f"Task {task_id} failed: {exc}",
+                                               exc_info=exc)
+                with app.app_context():
+                    socketio.emit('task_complete', {
+                        'task': task_id.rsplit('_', 1)[0],
+                        'result': {'success': False, 'error': str(exc)}
+                    }, namespace='/')
+
+        status = 'queued' if len(active_tasks) >= task_workers else 'started'
+        future = executor.submit(target)
+        active_tasks[task_id] = future
+        future.add_done_callback(finished)
+        return task_id, status
+
     # Routes
     @app.route('/')
     def index():
@@ -56,17 +239,10 @@ def create_app():
             status = {
                 'timestamp': datetime.now().isoformat(),
                 'vivisect_version': '1.0.0',
-                'modules': {
-                    'disk_imaging': config.get('modules.disk_imaging.enabled', True),
-                    'file_analysis': config.get('modules.file_analysis.enabled', True),
-                    'network_forensics': config.get('modules.network_forensics.enabled', True),
-                    'memory_analysis': config.get('modules.memory_analysis.enabled', True),
-                    'artifact_extraction': config.get('modules.artifact_extraction.enabled', True),
-                    'usb_gadget': config.get('modules.usb_gadget.enabled', True)
-                },
+                'modules': modules_enabled,
                 'active_tasks': len(active_tasks),
-                'output_dir': config.get('output_dir'),
-                'log_dir': config.get('log_dir'),
+                'output_dir': output_dir,
+                'log_dir': log_dir,
                 'usb_connected': usb_gadget.is_connected_to_host()
             }
             return jsonify(status)
@@ -86,7 +262,7 @@ def create_app():
     def create_disk_image():
         """Create disk image"""
         try:
-            data = request.json
+            data = json_body()
             device = data.get('device')
             output = data.get('output')
             method = data.get('method', 'dd')
@@ -107,11 +283,12 @@ def create_app():
                         'result': result
                     }, namespace='/')
 
-            task_id = f"disk_image_{datetime.now().timestamp()}"
-            active_tasks[task_id] = threading.Thread(target=run_imaging)
-            active_tasks[task_id].start()
+            task_id = f"disk_image_{time.monotonic_ns()}"
+            task_id, status = start_task(task_id, run_imaging, exclusive='disk_image')
+            if status == 'already_running':
+                return jsonify({'task_id': task_id, 'status': status}), 202
 
-            return jsonify({'task_id': task_id, 'status': 'started'})
+            return jsonify({'task_id': task_id, 'status': status})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -128,7 +305,7 @@ def create_app():
     def start_capture():
         """Start network capture"""
         try:
-            data = request.json
+            data = json_body()
             interface = data.get('interface')
             output = data.get('output')
             duration = data.get('duration', 60)
@@ -148,11 +325,10 @@ def create_app():
                         'result': result
                     }, namespace='/')
 
-            task_id = f"capture_{datetime.now().timestamp()}"
-            active_tasks[task_id] = threading.Thread(target=run_capture)
-            active_tasks[task_id].start()
+            task_id = f"capture_{time.monotonic_ns()}"
+            task_id, status = start_task(task_id, run_capture)
 
-            return jsonify({'task_id': task_id, 'status': 'started'})
+            return jsonify({'task_id': task_id, 'status': status})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -169,7 +345,7 @@ def create_app():
     def create_memory_dump():
         """Create memory dump"""
         try:
-            data = request.json
+            data = json_body()
             output = data.get('output')
             method = data.get('method', 'auto')
 
@@ -186,11 +362,12 @@ def create_app():
                         'result': result
                     }, namespace='/')
 
-            task_id = f"memory_dump_{datetime.now().timestamp()}"
-            active_tasks[task_id] = threading.Thread(target=run_dump)
-            active_tasks[task_id].start()
+            task_id = f"memory_dump_{time.monotonic_ns()}"
+            task_id, status = start_task(task_id, run_dump, exclusive='memory_dump')
+            if status == 'already_running':
+                return jsonify({'task_id': task_id, 'status': status}), 202
 
-            return jsonify({'task_id': task_id, 'status': 'started'})
+            return jsonify({'task_id': task_id, 'status': status})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -225,7 +402,7 @@ def create_app():
     def calculate_hash():
         """Calculate file hash"""
         try:
-            data = request.json
+            data = json_body()
             filepath = data.get('filepath')
             hashes = file_analysis.calculate_hashes(filepath)
             return jsonify({'hashes': hashes})
@@ -236,7 +413,7 @@ def create_app():
     def get_metadata():
         """Get file metadata"""
         try:
-            data = request.json
+            data = json_body()
             filepath = data.get('filepath')
             metadata = file_analysis.get_file_metadata(filepath)
             return jsonify(metadata)
@@ -247,15 +424,15 @@ def create_app():
     def run_collection():
         """Run full forensics collection"""
         try:
-            data = request.json
+            data = json_body()
             case_id = data.get('case_id', f"CASE-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
 
             def run_full_collection():
+                progress = ProgressThrottle(app, socketio)
                 report = report_gen.create_report(case_id)
 
                 # Memory analysis
-                with app.app_context():
-                    socketio.emit('progress', {'step': 'memory', 'status': 'running'}, namespace='/')
+                progress.push({'step': 'memory', 'status': 'running'})
                 memory_data = memory_analysis.analyze_running_system()
                 report_gen.add_finding(report, 'memory', {
                     'type': 'live_analysis',
@@ -263,8 +440,7 @@ def create_app():
                 })
 
                 # Browser artifacts
-                with app.app_context():
-                    socketio.emit('progress', {'step': 'browser', 'status': 'running'}, namespace='/')
+                progress.push({'step': 'browser', 'status': 'running'})
                 browser_data = artifact_extraction.extract_browser_history()
                 report_gen.add_finding(report, 'artifacts', {
                     'type': 'browser',
@@ -272,8 +448,7 @@ def create_app():
                 })
 
                 # System logs
-                with app.app_context():
-                    socketio.emit('progress', {'step': 'logs', 'status': 'running'}, namespace='/')
+                progress.push({'step': 'logs', 'status': 'running'})
                 logs_data = artifact_extraction.extract_system_logs()
                 report_gen.add_finding(report, 'artifacts', {
                     'type': 'logs',
@@ -281,8 +456,7 @@ def create_app():
                 })
 
                 # Persistence
-                with app.app_context():
-                    socketio.emit('progress', {'step': 'persistence', 'status': 'running'}, namespace='/')
+                progress.push({'step': 'persistence', 'status': 'running'})
                 persist_data = artifact_extraction.extract_persistence_mechanisms()
                 report_gen.add_finding(report, 'artifacts', {
                     'type': 'persistence',
@@ -293,6 +467,8 @@ def create_app():
                 json_report = report_gen.save_report(report, 'json')
                 html_report = report_gen.save_report(report, 'html')
 
+                # Deliver any held step before the completion event
+                progress.flush()
                 with app.app_context():
                     socketio.emit('task_complete', {
                         'task': 'collection',
@@ -303,11 +479,12 @@ def create_app():
                         }
                     }, namespace='/')
 
-            task_id = f"collection_{datetime.now().timestamp()}"
-            active_tasks[task_id] = threading.Thread(target=run_full_collection)
-            active_tasks[task_id].start()
+            task_id = f"collection_{time.monotonic_ns()}"
+            task_id, status = start_task(task_id, run_full_collection, exclusive='collection')
+            if status == 'already_running':
+                return jsonify({'task_id': task_id, 'status': status}), 202
 
-            return jsonify({'task_id': task_id, 'case_id': case_id, 'status': 'started'})
+            return jsonify({'task_id': task_id, 'case_id': case_id, 'status': status})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -315,21 +492,21 @@ def create_app():
     def list_reports():
         """List available reports"""
         try:
-            output_dir = config.get('output_dir')
             reports = []
 
             if os.path.exists(output_dir):
-                for filename in os.listdir(output_dir):
-                    filepath = os.path.join(output_dir, filename)
-                    if os.path.isfile(filepath):
-                        reports.append({
-                            'filename': filename,
-                            'path': filepath,
-                            'size': os.path.getsize(filepath),
-                            'modified': datetime.fromtimestamp(
-                                os.path.getmtime(filepath)
-                            ).isoformat()
-                        })
+                # scandir entries carry the file type and cache their stat,
+                # so each report costs at most one stat call
+                with os.scandir(output_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            st = entry.stat()
+                            reports.append({
+                                'filename': entry.name,
+                                'path': entry.path,
+                                'size': st.st_size,
+                                'modified': datetime.fromtimestamp(st.st_mtime).isoformat()
+                            })
 
             reports.sort(key=lambda x: x['modified'], reverse=True)
             return jsonify({'reports': reports})
@@ -340,11 +517,14 @@ def create_app():
     def download_report(filename):
         """Download a report"""
         try:
-            output_dir = config.get('output_dir')
-            filepath = os.path.join(output_dir, filename)
-
-            if os.path.exists(filepath):
-                return send_file(filepath, as_attachment=True)
+            filepath = safe_join(output_dir, filename)
+
+            if filepath is not None and os.path.isfile(filepath):
+                # Conditional responses answer If-None-Match/If-Modified-Since
+                # with 304 and Range with 206; max_age=0 makes browsers
+                # revalidate rather than fetch the whole report again
+                return send_file(filepath, as_attachment=True, conditional=True,
+                                 etag=True, max_age=0)
             else:
                 return jsonify({'error': 'Report not found'}), 404
         except Exception as e:
@@ -354,14 +534,11 @@ def create_app():
     def get_logs(module):
         """Get logs for a specific module"""
         try:
-            log_dir = config.get('log_dir')
             log_file = os.path.join(log_dir, f"{module}.log")
 
             if os.path.exists(log_file):
-                with open(log_file, 'r') as f:
-                    # Get last 100 lines
-                    lines = f.readlines()[-100:]
-                    return jsonify({'logs': lines})
+                # Get last 100 lines without reading the whole log
+                return jsonify({'logs': tail_lines(log_file, 100)})
             else:
                 return jsonify({'logs': []})
         except Exception as e:
@@ -405,11 +582,10 @@ def create_app():
                         'result': result
                     }, namespace='/')
 
-            task_id = f"mass_storage_sync_{datetime.now().timestamp()}"
-            active_tasks[task_id] = threading.Thread(target=run_sync)
-            active_tasks[task_id].start()
+            task_id = f"mass_storage_sync_{time.monotonic_ns()}"
+            task_id, status = start_task(task_id, run_sync)
 
-            return jsonify({'task_id': task_id, 'status': 'started'})
+            return jsonify({'task_id': task_id, 'status': status})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -426,7 +602,7 @@ def create_app():
     def switch_usb_mode():
         """Switch USB gadget mode"""
         try:
-            data = request.json or {}
+            data = json_body()
             mode = data.get('mode')  # 'multi', 'mass_storage', 'ether'
             read_only = data.get('read_only', False)
 
@@ -468,12 +644,14 @@ def create_app():
     def start_usb_capture():
         """Start packet capture on USB interface"""
         try:
-            data = request.json or {}
+            data = json_body()
             output_file = data.get('output_file')
+            duration = data.get('duration')
+            max_bytes = data.get('max_bytes')
 
             def run_capture():
                 try:
-                    result = usb_gadget.start_packet_capture(output_file)
+                    result = usb_gadget.start_packet_capture(output_file, duration, max_bytes)
                 except Exception as e:
                     result = {'success': False, 'error': str(e)}
 
@@ -483,11 +661,19 @@ def create_app():
                         'result': result
                     }, namespace='/')
 
-            task_id = f"usb_capture_{datetime.now().timestamp()}"
-            active_tasks[task_id] = threading.Thread(target=run_capture)
-            active_tasks[task_id].start()
+            task_id = f"usb_capture_{time.monotonic_ns()}"
+            task_id, status = start_task(task_id, run_capture)
 
-            return jsonify({'task_id': task_id, 'status': 'started'})
+            return jsonify({'task_id': task_id, 'status': status})
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/usb/capture/stop', methods=['POST'])
+    def stop_usb_capture():
+        """Stop packet capture on USB interface"""
+        try:
+            result = usb_gadget.stop_packet_capture()
+            return jsonify(result)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -507,11 +693,12 @@ def create_app():
                         'result': result
                     }, namespace='/')
 
-            task_id = f"usb_auto_collect_{datetime.now().timestamp()}"
-            active_tasks[task_id] = threading.Thread(target=run_auto_collect)
-            active_tasks[task_id].start()
+            task_id = f"usb_auto_collect_{time.monotonic_ns()}"
+            task_id, status = start_task(task_id, run_auto_collect, exclusive='usb_auto_collect')
+            if status == 'already_running':
+                return jsonify({'task_id': task_id, 'status': status}), 202
 
-            return jsonify({'task_id': task_id, 'status': 'started'})
+            return jsonify({'task_id': task_id, 'status': status})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -550,7 +737,7 @@ def create_app():
     def send_hid_string():
         """Send a string via HID keyboard"""
         try:
-            data = request.json or {}
+            data = json_body()
             text = data.get('text', '')
             delay_ms = data.get('delay_ms', 50)
 
@@ -572,13 +759,12 @@ def create_app():
                         'result': result
                     }, namespace='/')
 
-            task_id = f"hid_string_{datetime.now().timestamp()}"
-            active_tasks[task_id] = threading.Thread(target=run_hid_string)
-            active_tasks[task_id].start()
+            task_id = f"hid_string_{time.monotonic_ns()}"
+            task_id, status = start_task(task_id, run_hid_string)
 
             return jsonify({
                 'task_id': task_id,
-                'status': 'started',
+                'status': status,
                 'text_length': len(text)
             })
         except Exception as e:
@@ -588,7 +774,7 @@ def create_app():
     def execute_hid_payload():
         """Execute a pre-built HID payload"""
         try:
-            data = request.json or {}
+            data = json_body()
             payload_name = data.get('payload_name')
 
             if not payload_name:
@@ -606,13 +792,12 @@ def create_app():
                         'result': result
                     }, namespace='/')
 
-            task_id = f"hid_payload_{datetime.now().timestamp()}"
-            active_tasks[task_id] = threading.Thread(target=run_hid_payload)
-            active_tasks[task_id].start()
+            task_id = f"hid_payload_{time.monotonic_ns()}"
+            task_id, status = start_task(task_id, run_hid_payload)
 
             return jsonify({
                 'task_id': task_id,
-                'status': 'started',
+                'status': status,
                 'payload': payload_name
             })
         except Exception as e: